@@ -0,0 +1,63 @@
+"""Requests/sec against a running server at high concurrency.
+
+    python -m uvicorn lovely_prompts_server.server:app --port 8000 --log-level warning --timeout-keep-alive 60
+    python benchmarks/bench_api.py --concurrency 64 --requests 5000
+
+Half of the requests log a prompt, the other half read back a prompt logged earlier. Needs httpx.
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+import httpx
+
+
+async def worker(client: httpx.AsyncClient, args, counter: list, ids: list, latencies: list):
+    while counter[0] < args.requests:
+        n = counter[0]
+        counter[0] += 1
+
+        start = time.perf_counter()
+        if n % 2:
+            res = await client.get(f"/chat_prompts/{random.choice(ids)}", params={"project": args.project})
+        else:
+            res = await client.post(
+                "/chat_prompts/",
+                params={"project": args.project},
+                json={"prompt": [{"role": "user", "content": f"Benchmark prompt {n}"}], "title": "bench"},
+            )
+        res.raise_for_status()
+        latencies.append(time.perf_counter() - start)
+        if not n % 2:
+            ids.append(res.json()["id"])
+
+
+async def main(args):
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=60) as client:
+        # Make sure the project exists before the clock starts.
+        res = await client.post("/chat_prompts/", params={"project": args.project}, json={"title": "warmup"})
+
+        counter, ids, latencies = [0], [res.json()["id"]], []
+        start = time.perf_counter()
+        await asyncio.gather(*[worker(client, args, counter, ids, latencies) for _ in range(args.concurrency)])
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    print(f"{len(latencies)} requests, concurrency {args.concurrency}: {len(latencies) / elapsed:.0f} req/s")
+    print(
+        f"latency ms: p50 {statistics.median(latencies) * 1000:.1f}"
+        f"  p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--project", default="bench")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--requests", type=int, default=5000)
+    asyncio.run(main(parser.parse_args()))
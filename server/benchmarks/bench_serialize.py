@@ -0,0 +1,122 @@
+"""CPU time per request of the API handlers, in-process, without the network and the HTTP server.
+
+    python benchmarks/bench_serialize.py --requests 2000
+
+Logs prompts and responses, then reads back pages of prompts with their responses.
+An SSE subscriber is attached, so the update events are serialized and sent too.
+It runs on a temporary data dir. Needs httpx.
+
+It also times the serialization of one prompt alone: validating it again for the response_model, serializing it
+for the response and once more for the event, against a single dump_json() shared by both.
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+import httpx
+
+# Before the server is imported, it creates the default project on import.
+os.environ["XDG_DATA_HOME"] = tempfile.mkdtemp(prefix="lovely-prompts-bench-")
+
+from pydantic import TypeAdapter  # noqa: E402
+
+from lovely_prompts_server.server import app  # noqa: E402
+from lovely_prompts_server.event_queues import append_event_queue  # noqa: E402
+from lovely_prompts_server.models import ChatPromptModel  # noqa: E402
+
+
+MESSAGES = [
+    {"role": "system", "content": "You are a helpful assistant. " * 5},
+    {"role": "user", "content": "What is the true shape of the Earth? " * 3},
+    {"role": "assistant", "content": "It's an oblate spheroid. " * 10},
+    {"role": "user", "content": "Are you sure? " * 2},
+]
+
+
+async def consume(subscriber, counter: list):
+    async for _ in subscriber.events():
+        counter[0] += 1
+
+
+def timed(label: str, n: int, start: float):
+    print(f"{label:<36} {(time.process_time() - start) / n * 1e6:8.0f} us CPU/request")
+
+
+async def bench_requests(args):
+    events = [0]
+    consumer = asyncio.create_task(consume(append_event_queue(app, args.project), events))
+
+    params = {"project": args.project}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        await client.post("/chat_prompts/", params=params, json={"title": "warmup"})
+
+        start = time.process_time()
+        ids = []
+        for i in range(args.requests):
+            res = await client.post("/chat_prompts/", params=params, json={"prompt": MESSAGES, "title": f"p{i}"})
+            ids.append(res.json()["id"])
+        timed("POST /chat_prompts/", args.requests, start)
+
+        start = time.process_time()
+        for i in range(args.requests):
+            response = {"prompt_id": ids[i], "content": "Flat, of course! " * 20, "model": "gpt-4", "tok_out": 60}
+            res = await client.post("/chat_responses/", params=params, json=response)
+            res.raise_for_status()
+        timed("POST /chat_responses/", args.requests, start)
+
+        start = time.process_time()
+        for i in range(args.requests):
+            res = await client.get(f"/chat_prompts/{ids[i]}", params=params)
+            res.raise_for_status()
+        timed("GET /chat_prompts/{id}", args.requests, start)
+
+        pages = max(1, args.requests // 20)
+        start = time.process_time()
+        for _ in range(pages):
+            res = await client.get("/chat_prompts/", params=params | {"limit": 100})
+            res.raise_for_status()
+        timed("GET /chat_prompts/?limit=100", pages, start)
+
+    await asyncio.sleep(0.1)
+    consumer.cancel()
+    print(f"{events[0]} SSE events sent")
+
+
+def bench_serialization(n: int):
+    model = ChatPromptModel.model_validate(
+        {
+            "id": "chp_Cf5Gjbv9TCUSIexr",
+            "created": "2024-01-01T00:00:00",
+            "updated": "2024-01-01T00:00:00",
+            "title": "bench",
+            "prompt": MESSAGES,
+            "responses": [{"id": f"chr_{i}", "prompt_id": "chp_Cf5Gjbv9TCUSIexr", "content": "x" * 300} for i in range(3)],
+        }
+    )
+    adapter = TypeAdapter(ChatPromptModel)
+
+    start = time.perf_counter()
+    for _ in range(n):
+        adapter.dump_json(adapter.validate_python(model), exclude_unset=True)  # response_model
+        model.model_dump_json(exclude_unset=True)  # The event
+    separate = (time.perf_counter() - start) / n
+
+    start = time.perf_counter()
+    for _ in range(n):
+        adapter.dump_json(model, exclude_unset=True)
+    once = (time.perf_counter() - start) / n
+
+    print(f"serialize a prompt: validate + 2 dumps {separate * 1e6:.1f} us, one dump {once * 1e6:.1f} us")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--project", default="bench")
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    bench_serialization(args.requests * 10)
+    asyncio.run(bench_requests(args))
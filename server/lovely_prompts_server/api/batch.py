@@ -0,0 +1,90 @@
+from typing import Dict, List
+
+import json
+
+from fastapi import APIRouter, HTTPException, Request
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+
+from lovely_prompts_server.common import TAG_API, UpdateEvents
+
+from lovely_prompts_server.event_queues import update_event_queues
+from lovely_prompts_server.metrics import metrics
+
+from lovely_prompts_server.models import Batch, BatchResult
+from lovely_prompts_server.db.session import get_session
+from lovely_prompts_server.api.crud import Entries
+from lovely_prompts_server.api.chat_prompts import CHAT_PROMPTS
+from lovely_prompts_server.api.chat_responses import CHAT_RESPONSES
+from lovely_prompts_server.api.completion_prompts import COMPLETION_PROMPTS
+from lovely_prompts_server.api.completion_responses import COMPLETION_RESPONSES
+
+
+router = APIRouter()
+
+
+# The entry types, in the order the tables are written. The prompts go first, the responses reference them.
+BATCH_ENTRIES: Dict[str, Entries] = {
+    entries.name: entries for entries in (CHAT_PROMPTS, COMPLETION_PROMPTS, CHAT_RESPONSES, COMPLETION_RESPONSES)
+}
+
+
+@router.post("/batch/", response_model=BatchResult, tags=[TAG_API])
+async def create_batch(
+    request: Request, batch: Batch, project: str = "default", reuse: bool = False, replay: bool = False
+):
+    """With `reuse=true`, prompts are deduplicated like in POST /chat_prompts/?reuse=true.
+    The prompts that already exist are skipped, their responses are added to the existing ones.
+
+    With `replay=true`, all the entries that already exist are skipped, so a batch can be sent again
+    if the response to it was lost. The entries need client-generated ids for this, see the Logger spool."""
+    rows: Dict[str, List[dict]] = {name: [] for name in BATCH_ENTRIES}
+    for item in batch.entries:
+        entries = BATCH_ENTRIES[item.type]
+        if entries.responses is not None:
+            row = entries.row(item.entry, reuse=reuse)
+            rows[item.type].append(row)
+            responses = entries.responses
+            rows[responses.name].extend(responses.row(r, prompt_id=row["id"]) for r in item.entry.responses)
+        else:
+            if item.entry.prompt_id is None:
+                raise HTTPException(status_code=422, detail=f"{entries.payload.__name__} in a batch needs a prompt_id")
+            rows[item.type].append(entries.row(item.entry))
+
+    inserted: Dict[str, int] = {}
+    async with get_session(request=request, project=project, write=True) as db:
+        try:
+            connection = await db.connection()
+            for name, entries in BATCH_ENTRIES.items():
+                if not rows[name]:
+                    continue
+                query = insert(entries.schema)
+                # The same content gets the same id, or it's the same entry sent again.
+                if replay or (reuse and entries.responses is not None):
+                    query = query.prefix_with("OR IGNORE")
+                # On the connection, so the result has the rowcount, summed over the executemany.
+                # Those are the rows actually inserted, without the ones OR IGNORE skipped.
+                inserted[name] = (await connection.execute(query, rows[name])).rowcount
+            await db.commit()
+        except IntegrityError as e:
+            await db.rollback()
+            raise HTTPException(status_code=409, detail=f"Batch rejected: {e.orig}")
+
+    for name, n in inserted.items():
+        metrics.ingested_rows.inc(project, name, value=n)
+
+    result = BatchResult(**{f"{name}s": [row["id"] for row in rows[name]] for name in BATCH_ENTRIES})
+
+    # One event for the whole batch. The webapp refetches what it needs.
+    data = {
+        "chat_prompts": result.chat_prompts,
+        "chat_responses": [{"id": row["id"], "prompt_id": row["prompt_id"]} for row in rows["chat_response"]],
+    }
+    if rows["completion_prompt"] or rows["completion_response"]:
+        data["completion_prompts"] = result.completion_prompts
+        data["completion_responses"] = [
+            {"id": row["id"], "prompt_id": row["prompt_id"]} for row in rows["completion_response"]
+        ]
+    update_event_queues(request.app, {"event": UpdateEvents.NEW_BATCH, "data": json.dumps(data)}, project=project)
+
+    return result
@@ -0,0 +1,46 @@
+import asyncio
+
+from fastapi import APIRouter, Request
+
+from lovely_prompts_server.common import TAG_API, UpdateEvents
+from lovely_prompts_server.event_queues import update_event_queues
+from lovely_prompts_server.metrics import metrics
+from lovely_prompts_server.models import ImportResult
+from lovely_prompts_server.db.session import get_session
+from lovely_prompts_server.bulk_import import Importer, LineSplitter, insert_rows
+
+
+router = APIRouter()
+
+
+@router.post("/import/", response_model=ImportResult, tags=[TAG_API])
+async def import_jsonl(request: Request, project: str = "default"):
+    """Import a JSONL body, in the /export/ format or OpenAI chat completion dumps.
+
+    Unlike the CLI, this keeps all indexes up to date as it goes, the server might be writing to the project too.
+    For big backfills, `lovely-prompts-server import` is a lot faster."""
+    importer = Importer()
+
+    async def write():
+        rows, size = importer.take()
+        if not size:
+            return
+        # Short transactions under the write lock, so the loggers can get in between the batches.
+        async with get_session(request=request, project=project, write=True) as db:
+            counts = await db.run_sync(lambda session: insert_rows(session.connection(), rows))
+        importer.written(counts)
+        for kind, n in counts.items():
+            metrics.ingested_rows.inc(project, kind, value=n)
+
+    splitter = LineSplitter()
+    async for chunk in request.stream():
+        lines = splitter.feed(chunk)
+        # Parsing and validation is CPU-bound, keep it off the event loop.
+        if lines and await asyncio.to_thread(importer.add_lines, lines):
+            await write()
+    importer.add_line(splitter.rest())
+    await write()
+
+    # Too much to send one by one, let the webapp reload.
+    update_event_queues(request.app, {"event": UpdateEvents.RESYNC, "data": "{}"}, project=project)
+    return importer.result
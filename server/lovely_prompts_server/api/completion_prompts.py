@@ -0,0 +1,25 @@
+from fastapi import APIRouter
+
+from lovely_prompts_server.common import UpdateEvents
+from lovely_prompts_server.models import CompletionPrompt, CompletionPromptModel
+from lovely_prompts_server.db.local import CompletionPromptSchema
+from lovely_prompts_server.api.crud import Entries, add_prompt_routes
+from lovely_prompts_server.api.completion_responses import COMPLETION_RESPONSES
+
+router = APIRouter()
+
+COMPLETION_PROMPTS = Entries(
+    "completion_prompt",
+    CompletionPromptSchema,
+    CompletionPrompt,
+    CompletionPromptModel,
+    content="prompt",
+    events=(
+        UpdateEvents.NEW_COMPLETION_PROMPT,
+        UpdateEvents.UPDATE_COMPLETION_PROMPT,
+        UpdateEvents.DELETE_COMPLETION_PROMPT,
+    ),
+    responses=COMPLETION_RESPONSES,
+)
+
+add_prompt_routes(router, COMPLETION_PROMPTS)
@@ -0,0 +1,25 @@
+from fastapi import APIRouter
+
+from lovely_prompts_server.common import UpdateEvents
+from lovely_prompts_server.models import CompletionResponse, CompletionResponseModel
+from lovely_prompts_server.db.local import CompletionPromptSchema, CompletionResponseSchema
+from lovely_prompts_server.api.crud import Entries, add_response_routes
+
+router = APIRouter()
+
+COMPLETION_RESPONSES = Entries(
+    "completion_response",
+    CompletionResponseSchema,
+    CompletionResponse,
+    CompletionResponseModel,
+    content="content",
+    events=(
+        UpdateEvents.NEW_COMPLETION_RESPONSE,
+        UpdateEvents.UPDATE_COMPLETION_RESPONSE,
+        UpdateEvents.DELETE_COMPLETION_RESPONSE,
+    ),
+    prompt_schema=CompletionPromptSchema,
+    stream_event=UpdateEvents.STREAM_COMPLETION_RESPONSE,
+)
+
+add_response_routes(router, COMPLETION_RESPONSES)
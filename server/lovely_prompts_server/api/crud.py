@@ -0,0 +1,426 @@
+from typing import List, Optional, Tuple, Type, Union
+from datetime import datetime
+import asyncio
+import json
+
+import fastapi
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from pydantic import BaseModel, TypeAdapter, ValidationError
+
+from sqlalchemy import select
+from sqlalchemy.orm import defer, selectinload
+
+from lovely_prompts_server.common import TAG_WEBAPP, TAG_API, UpdateEvents
+
+from lovely_prompts_server.event_queues import update_event_queues
+from lovely_prompts_server.metrics import metrics
+from lovely_prompts_server.streaming import StreamBuffer, stream_updates
+from lovely_prompts_server.ws_protocol import WS_COMPACT_PROTOCOL, decode_frame
+
+from lovely_prompts_server.models import WSMessage, make_id, prompt_content_id, prompt_hash
+from lovely_prompts_server.db.session import get_session, check_project_exists
+from lovely_prompts_server.db.pagination import CURSOR_HEADER, paginate, next_cursor
+
+
+# The chat and the completion entries have the same routes, only the tables and the models differ.
+# Each api/ module describes its entry type with an Entries, and gets the routes with add_prompt_routes()
+# or add_response_routes(). /batch/ and /stream/ use the same descriptions.
+#
+# The handlers serialize each entry once, with Entries.dump(), and return the bytes in a json_response().
+# The update events carry the same bytes. Returning the model instead would have FastAPI validate it again
+# against the response_model and serialize it separately. The response_model stays on the routes for the docs.
+
+
+class Entries:
+    """An entry type, as the generic routes see it."""
+
+    def __init__(
+        self,
+        name: str,  # "chat_prompt", also the type in /batch/ and the path
+        schema,  # The SQL table
+        payload: Type[BaseModel],  # What the client sends, ChatPrompt
+        model: Type[BaseModel],  # What the client gets back, ChatPromptModel
+        content: str,  # The body, it's left out with include_content=false
+        events: Tuple[UpdateEvents, UpdateEvents, UpdateEvents],  # new, update, delete
+        responses: Optional["Entries"] = None,  # For the prompts
+        prompt_schema=None,  # For the responses
+        stream_event: Optional[UpdateEvents] = None,  # For the responses
+    ):
+        self.name = name
+        self.path = f"/{name}s/"
+        self.schema = schema
+        self.payload = payload
+        self.model = model
+        self.content = content
+        self.new_event, self.update_event, self.delete_event = events
+        self.responses = responses
+        self.prompt_schema = prompt_schema
+        self.stream_event = stream_event
+
+        # The fields a row takes from the payload. All rows get all of them, so a batch is a single executemany.
+        self.keys = payload.model_fields.keys() - {"id", "responses"}
+
+        self._adapter = TypeAdapter(model)
+        self._list_adapter = TypeAdapter(List[model])
+
+    def dump(self, model: Union[BaseModel, List[BaseModel]]) -> bytes:
+        """The model, or a list of them, as JSON. The same as FastAPI sends with response_model_exclude_unset."""
+        adapter = self._list_adapter if isinstance(model, list) else self._adapter
+        return adapter.dump_json(model, exclude_unset=True)
+
+    def row(self, entry: BaseModel, reuse=False, prompt_id: str = None) -> dict:
+        """The entry as a row for insert(), with the id and the prompt hash set.
+        With `reuse`, a prompt gets the id derived from its content, see models.prompt_content_id()."""
+        row = dict.fromkeys(self.keys) | entry.model_dump(exclude={"id", "responses"})
+        if self.responses is not None:
+            row["id"] = prompt_content_id(row["prompt"], self.payload) if reuse else entry.id or make_id(self.payload)
+            row["prompt_hash"] = prompt_hash(row["prompt"])
+        else:
+            row["id"] = entry.id or make_id(self.payload)
+            if prompt_id is not None:
+                row["prompt_id"] = prompt_id
+        return row
+
+
+def json_response(body: bytes, headers: Optional[dict] = None) -> Response:
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def entry_model(entries: Entries, row, include_responses=True, include_content=True) -> BaseModel:
+    nested = entries.responses is not None
+    if include_content and (include_responses or not nested):
+        return entries.model.model_validate(row)
+
+    # Leave the fields we did not load unset, so they are dropped from the response instead of showing up empty.
+    skip = {"responses"} | ({entries.content} if not include_content else set())
+    data = {key: getattr(row, key) for key in entries.model.model_fields if key not in skip}
+    if include_responses and nested:
+        fields = entries.responses.payload.model_fields
+        data["responses"] = [
+            {key: getattr(response, key) for key in fields if key != entries.responses.content}
+            for response in row.responses
+        ]
+    return entries.model.model_validate(data)
+
+
+def add_prompt_routes(router: APIRouter, entries: Entries):
+    schema, label = entries.schema, entries.payload.__name__
+    path, item_path = entries.path, entries.path + "{prompt_id}"
+
+    async def query_prompt(db, prompt_id: str):
+        return await db.scalar(select(schema).options(selectinload(schema.responses)).where(schema.id == prompt_id))
+
+    @router.get(
+        path,
+        name=f"get_{entries.name}s",
+        response_model=List[entries.model],
+        response_model_exclude_unset=True,
+        dependencies=[Depends(check_project_exists)],
+        tags=[TAG_WEBAPP],
+    )
+    async def get_prompts(
+        request: Request,
+        project: str = "default",
+        cursor: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        skip: int = 0,
+        limit: int = 100,
+        include_responses: bool = True,
+        include_content: bool = True,
+    ):
+        """Newest first. Pass the X-Next-Cursor header from the previous page as `cursor` to get the next one.
+
+        `skip` still works, but it scans all the skipped rows, prefer the cursor.
+        With `include_responses=false` the responses are not loaded at all, and the `responses` key is omitted.
+        With `include_content=false` the bodies, the prompts and the response contents, are not read either."""
+        async with get_session(request=request, project=project) as db:
+            query = select(schema)
+            if include_responses:
+                # One extra query for the responses of the whole page.
+                responses = selectinload(schema.responses)
+                if not include_content:
+                    content = getattr(entries.responses.schema, entries.responses.content)
+                    responses = responses.defer(content, raiseload=True)
+                query = query.options(responses)
+            if not include_content:
+                query = query.options(defer(getattr(schema, entries.content), raiseload=True))
+            rows = (await db.execute(paginate(query, schema, cursor, since, until, limit).offset(skip))).all()
+
+            models = [entry_model(entries, row, include_responses, include_content) for row, _ in rows]
+
+        headers = {CURSOR_HEADER: next_page} if (next_page := next_cursor(rows, limit)) is not None else None
+        return json_response(entries.dump(models), headers)
+
+    @router.get(
+        item_path,
+        name=f"get_{entries.name}",
+        response_model=entries.model,
+        response_model_exclude_unset=True,
+        dependencies=[Depends(check_project_exists)],
+        tags=[TAG_WEBAPP],
+    )
+    async def get_prompt(request: Request, prompt_id: str, project: str = "default", include_responses: bool = True):
+        async with get_session(request=request, project=project) as db:
+            if include_responses:
+                db_prompt = await query_prompt(db, prompt_id)
+            else:
+                db_prompt = await db.get(schema, prompt_id)
+
+            if db_prompt is None:
+                raise HTTPException(status_code=404, detail="Prompt not found")
+
+            return json_response(entries.dump(entry_model(entries, db_prompt, include_responses)))
+
+    @router.post(
+        path,
+        name=f"create_{entries.name}",
+        response_model=entries.model,
+        response_model_exclude_unset=True,
+        tags=[TAG_API],
+    )
+    async def create_prompt(request: Request, payload: entries.payload, project: str = "default", reuse: bool = False):
+        """With `reuse=true`, the id is derived from the prompt, see models.prompt_content_id().
+        If the project already has that prompt, it's returned as is, and the new responses attach to it."""
+        row = entries.row(payload, reuse=reuse)
+
+        async with get_session(request=request, project=project, write=True) as db:
+            if reuse and (db_prompt := await db.get(schema, row["id"])) is not None:
+                return json_response(entries.dump(entry_model(entries, db_prompt, include_responses=False)))
+
+            db_prompt = schema(**{key: value for key, value in row.items() if value is not None}, responses=[])
+            db.add(db_prompt)
+            await db.commit()
+            metrics.ingested_rows.inc(project, entries.name)
+            body = entries.dump(entries.model.model_validate(db_prompt))
+
+            update_event_queues(request.app, {"event": entries.new_event, "data": body}, project=project)
+        return json_response(body)
+
+    @router.put(
+        item_path,
+        name=f"update_{entries.name}",
+        response_model=entries.model,
+        response_model_exclude_unset=True,
+        dependencies=[Depends(check_project_exists)],
+        tags=[TAG_API],
+    )
+    async def update_prompt(request: Request, prompt_id: str, diff: entries.payload, project: str = "default"):
+        async with get_session(request=request, project=project, write=True) as db:
+            db_prompt = await query_prompt(db, prompt_id)
+            if db_prompt is None:
+                raise HTTPException(status_code=404, detail=f"{label} with id={prompt_id} not found")
+
+            for key, value in diff.model_dump(exclude={"id", "responses"}).items():
+                setattr(db_prompt, key, value)
+            db_prompt.prompt_hash = prompt_hash(db_prompt.prompt)
+
+            await db.commit()
+            body = entries.dump(entries.model.model_validate(db_prompt))
+
+            update_event_queues(request.app, {"event": entries.update_event, "data": body}, project=project)
+
+        return json_response(body)
+
+    @router.delete(
+        item_path,
+        name=f"delete_{entries.name}",
+        response_model_exclude_unset=True,
+        dependencies=[Depends(check_project_exists)],
+        tags=[TAG_API],
+        status_code=204,
+    )
+    async def delete_prompt(request: Request, prompt_id: str, project: str = "default"):
+        async with get_session(request=request, project=project, write=True) as db:
+            prompt = await query_prompt(db, prompt_id)
+            if not prompt:
+                raise HTTPException(status_code=404, detail=f"{label} with id={prompt_id} not found")
+            await db.delete(prompt)
+
+            update_event_queues(
+                request.app, {"event": entries.delete_event, "data": json.dumps({"id": prompt_id})}, project=project
+            )
+
+
+def add_response_routes(router: APIRouter, entries: Entries):
+    schema, label = entries.schema, entries.payload.__name__
+    path, item_path = entries.path, entries.path + "{response_id}"
+
+    @router.get(
+        path,
+        name=f"get_{entries.name}s",
+        response_model=List[entries.model],
+        response_model_exclude_unset=True,
+        dependencies=[Depends(check_project_exists)],
+        tags=[TAG_WEBAPP],
+    )
+    async def get_responses(
+        request: Request,
+        project: str = "default",
+        cursor: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        skip: int = 0,
+        limit: int = 100,
+        prompt_id: Optional[str] = None,
+        prompt_hash: Optional[str] = None,
+        include_content: bool = True,
+    ):
+        """Newest first, paginated like the prompts.
+
+        `prompt_hash` gives the responses to all the prompts with the same content, see the prompt_hash field.
+        With `include_content=false` the content is not read from the DB, and the `content` key is omitted."""
+        async with get_session(request=request, project=project) as db:
+            query = select(schema)
+            if not include_content:
+                query = query.options(defer(getattr(schema, entries.content), raiseload=True))
+            if prompt_id is not None:
+                query = query.where(schema.prompt_id == prompt_id)
+            if prompt_hash is not None:
+                same_prompts = select(entries.prompt_schema.id).where(entries.prompt_schema.prompt_hash == prompt_hash)
+                query = query.where(schema.prompt_id.in_(same_prompts))
+            rows = (await db.execute(paginate(query, schema, cursor, since, until, limit).offset(skip))).all()
+
+            models = [entry_model(entries, row, include_content=include_content) for row, _ in rows]
+
+        headers = {CURSOR_HEADER: next_page} if (next_page := next_cursor(rows, limit)) is not None else None
+        return json_response(entries.dump(models), headers)
+
+    @router.get(
+        item_path,
+        name=f"get_{entries.name}",
+        response_model=entries.model,
+        response_model_exclude_unset=True,
+        dependencies=[Depends(check_project_exists)],
+        tags=[TAG_WEBAPP],
+    )
+    async def get_response(response_id: str, request: Request, project: str = "default"):
+        async with get_session(request=request, project=project) as db:
+            db_response = await db.get(schema, response_id)
+            if db_response is None:
+                raise HTTPException(status_code=404, detail="Response not found")
+            return json_response(entries.dump(entries.model.model_validate(db_response)))
+
+    @router.post(
+        path,
+        name=f"create_{entries.name}",
+        response_model=entries.model,
+        response_model_exclude_unset=True,
+        tags=[TAG_API],
+    )
+    async def create_response(request: Request, payload: entries.payload, project: str = "default"):
+        async with get_session(request=request, project=project, write=True) as db:
+            db_response = schema(**payload.model_dump(exclude={"id"}), id=payload.id or make_id(entries.payload))
+
+            db.add(db_response)
+            await db.commit()
+            metrics.ingested_rows.inc(project, entries.name)
+
+            body = entries.dump(entries.model.model_validate(db_response))
+
+            update_event_queues(request.app, {"event": entries.new_event, "data": body}, project=project)
+
+            return json_response(body)
+
+    @router.put(
+        item_path,
+        name=f"update_{entries.name}",
+        response_model=entries.model,
+        response_model_exclude_unset=True,
+        dependencies=[Depends(check_project_exists)],
+        tags=[TAG_API],
+    )
+    async def update_response(request: Request, response_id: str, diff: entries.payload, project: str = "default"):
+        async with get_session(request=request, project=project, write=True) as db:
+            db_response = await db.get(schema, response_id)
+            if db_response is None:
+                raise HTTPException(status_code=404, detail=f"{label} with id={response_id} not found")
+
+            for key, value in diff.model_dump(exclude={"id"}).items():
+                setattr(db_response, key, value)
+
+            await db.commit()
+            body = entries.dump(entries.model.model_validate(db_response))
+
+            update_event_queues(request.app, {"event": entries.update_event, "data": body}, project=project)
+
+            return json_response(body)
+
+    @router.delete(
+        item_path,
+        name=f"delete_{entries.name}",
+        response_model_exclude_unset=True,
+        dependencies=[Depends(check_project_exists)],
+        tags=[TAG_API],
+        status_code=204,
+    )
+    async def delete_response(request: Request, response_id: str, project: str = "default"):
+        async with get_session(request=request, project=project, write=True) as db:
+            db_response = await db.get(schema, response_id)
+            if not db_response:
+                raise HTTPException(status_code=404, detail=f"{label} with id={response_id} not found")
+            prompt_id = db_response.prompt_id
+            await db.delete(db_response)
+            update_event_queues(
+                request.app,
+                {"event": entries.delete_event, "data": json.dumps({"id": response_id, "prompt_id": prompt_id})},
+                project=project,
+            )
+
+    @router.websocket(path + "{id}/update_stream/", name=f"stream_{entries.name}")
+    async def record_update_ws(
+        websocket: fastapi.WebSocket, id: str, project: str = "default", started: Optional[float] = None
+    ):
+        # Clients that ask for it get the compact protocol, see ws_protocol.py
+        # `started` is when the client sent the request to the model, unix time, see StreamTiming.
+        compact = WS_COMPACT_PROTOCOL in websocket.scope.get("subprotocols", [])
+        await websocket.accept(subprotocol=WS_COMPACT_PROTOCOL if compact else None)
+        async with get_session(request=websocket, project=project) as db:
+            db_response = await db.get(schema, id)
+        if db_response is None:
+            raise fastapi.WebSocketException(code=fastapi.status.WS_1008_POLICY_VIOLATION, reason="Response not found")
+
+        # The updates are forwarded to the webapp right away, but only checkpointed to the DB every so often.
+        stream = StreamBuffer(schema, id, started=started)
+        metrics.stream_websockets.inc("update_stream")
+        try:
+            while True:
+                try:
+                    frame = await asyncio.wait_for(websocket.receive(), timeout=stream.time_to_flush())
+                except asyncio.TimeoutError:
+                    # The client went quiet with some updates not saved yet.
+                    await stream.flush(websocket, project)
+                    continue
+                if frame["type"] == "websocket.disconnect":
+                    break
+
+                try:
+                    messages = ws_messages(frame, compact, id, db_response.prompt_id)
+                    stream_updates(websocket.app, project, stream, messages, entries.stream_event)
+                except (ValueError, ValidationError) as e:
+                    # The close reason has to fit in a control frame.
+                    raise fastapi.WebSocketException(code=fastapi.status.WS_1002_PROTOCOL_ERROR, reason=str(e)[:120])
+
+                if stream.time_to_flush() == 0:
+                    await stream.flush(websocket, project)
+        except fastapi.WebSocketDisconnect:
+            pass
+        finally:
+            # Save what's left, also if the stream was cut short.
+            metrics.stream_websockets.dec("update_stream")
+            await stream.close(websocket, project)
+
+
+def ws_messages(frame: dict, compact: bool, id: str, prompt_id: str) -> List[WSMessage]:
+    data = frame["text"] if frame.get("text") is not None else frame.get("bytes")
+    if compact:
+        # No validation per token, decode_frame() checks the types.
+        return [
+            WSMessage.model_construct(id=id, prompt_id=prompt_id, action=action, key=key, value=value)
+            for action, key, value in decode_frame(data)
+        ]
+
+    message = WSMessage.model_validate_json(data)
+    message.id = id  # We will pass the id on to the webapp via SSE, make sure it is set
+    message.prompt_id = prompt_id
+    return [message]
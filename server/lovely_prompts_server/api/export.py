@@ -0,0 +1,43 @@
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+
+from lovely_prompts_server.common import TAG_API
+from lovely_prompts_server.db.session import check_project_exists, project_engine
+from lovely_prompts_server.export import (
+    EXPORT_MEDIA_TYPES,
+    ExportFormat,
+    ExportTable,
+    export_filename,
+    export_project,
+)
+
+
+router = APIRouter()
+
+
+@router.get("/export/", dependencies=[Depends(check_project_exists)], tags=[TAG_API])
+async def export(project: str = "default", format: ExportFormat = "jsonl", table: ExportTable = "chat_responses"):
+    """Download the whole project. JSONL has all the prompts and responses, Parquet and Arrow have the one `table`."""
+    # A sync engine, Starlette runs the sync generator in a thread, chunk by chunk.
+    engine = project_engine(project)
+    connection = engine.connect()
+    try:
+        chunks = export_project(connection, format, table)
+    except RuntimeError as e:
+        connection.close()
+        engine.dispose()
+        raise HTTPException(status_code=501, detail=str(e))
+
+    def stream():
+        try:
+            yield from chunks
+        finally:
+            connection.close()
+            engine.dispose()
+
+    filename = export_filename(project, format, table)
+    return StreamingResponse(
+        stream(),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
@@ -0,0 +1,14 @@
+from fastapi import APIRouter, Request, Response
+
+from lovely_prompts_server.common import TAG_API
+from lovely_prompts_server.metrics import CONTENT_TYPE, metrics
+
+
+router = APIRouter()
+
+
+@router.get("/metrics", tags=[TAG_API], response_class=Response)
+async def get_metrics(request: Request):
+    """The server metrics, in the Prometheus text format. See metrics.py for what is counted."""
+    metrics.collect(request.app.event_bus.subscribers)
+    return Response(content=metrics.render(), media_type=CONTENT_TYPE)
@@ -1,12 +1,22 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends, Request
 
 from lovely_prompts_server.common import TAG_WEBAPP
-from lovely_prompts_server.db.session import list_projects
+from lovely_prompts_server.db.session import check_project_exists
 
 
 router = APIRouter()
 
 
 @router.get("/projects/", tags=[TAG_WEBAPP])
-def read_projects() -> list[str]:
-    return list_projects()
+async def read_projects(request: Request) -> list[str]:
+    return request.app.projects.list()
+
+
+@router.delete(
+    "/projects/{project}",
+    dependencies=[Depends(check_project_exists)],
+    tags=[TAG_WEBAPP],
+    status_code=204,
+)
+async def delete_project(request: Request, project: str):
+    await request.app.engines.delete(project)
@@ -0,0 +1,96 @@
+from typing import List, Literal
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from lovely_prompts_server.common import TAG_WEBAPP
+from lovely_prompts_server.models import SearchResult
+from lovely_prompts_server.db.session import get_session, check_project_exists
+
+
+router = APIRouter()
+
+
+SNIPPET_OPEN = "<mark>"
+SNIPPET_CLOSE = "</mark>"
+SNIPPET_TOKENS = 16
+
+# The FTS tables are joined on rowid, see db/fts.py. ORDER BY rank uses the bm25 weights configured there.
+# Ranking has to score every match, ordering by rowid (newest first) can stop after `limit` rows.
+SEARCH_ORDER = {"rank": "rank", "recent": "{fts}.rowid DESC"}
+
+
+def search_chat_prompts(order: str):
+    fts = "chat_prompts_fts"
+    return text(
+        f"""
+        SELECT p.id, p.title, snippet({fts}, -1, :open, :close, '…', {SNIPPET_TOKENS}) AS snippet, rank
+        FROM {fts} JOIN chat_prompts AS p ON p.rowid = {fts}.rowid
+        WHERE {fts} MATCH :query
+        ORDER BY {SEARCH_ORDER[order].format(fts=fts)} LIMIT :limit
+        """
+    )
+
+
+def search_chat_responses(order: str):
+    fts = "chat_responses_fts"
+    return text(
+        f"""
+        SELECT r.id, r.prompt_id, r.title, snippet({fts}, -1, :open, :close, '…', {SNIPPET_TOKENS}) AS snippet, rank
+        FROM {fts} JOIN chat_responses AS r ON r.rowid = {fts}.rowid
+        WHERE {fts} MATCH :query
+        ORDER BY {SEARCH_ORDER[order].format(fts=fts)} LIMIT :limit
+        """
+    )
+
+
+def fts_query(q: str) -> str:
+    """Search for all the words, taken literally. Quoting them keeps FTS5 operators and punctuation out of the way."""
+    return " ".join('"' + word.replace('"', '""') + '"' for word in q.split())
+
+
+@router.get(
+    "/search/",
+    response_model=List[SearchResult],
+    response_model_exclude_unset=True,
+    dependencies=[Depends(check_project_exists)],
+    tags=[TAG_WEBAPP],
+)
+async def search(
+    request: Request,
+    q: str,
+    project: str = "default",
+    kind: Literal["all", "chat_prompts", "chat_responses"] = "all",
+    limit: int = 50,
+    order: Literal["rank", "recent"] = "rank",
+    syntax: bool = False,
+):
+    """Best matches first, with a snippet around the match. The matched words are wrapped in <mark></mark>.
+
+    `order=recent` returns the newest matches instead. Much faster for words that match a big part of the project.
+
+    With `syntax=true`, `q` is passed to FTS5 as is, so you can use AND/OR/NOT, "phrases", prefix* and column:filters."""
+    query = q if syntax else fts_query(q)
+    if not query:
+        return []
+
+    params = {"query": query, "limit": limit, "open": SNIPPET_OPEN, "close": SNIPPET_CLOSE}
+    results = []
+    async with get_session(request=request, project=project) as db:
+        try:
+            if kind in ("all", "chat_prompts"):
+                for row in await db.execute(search_chat_prompts(order), params):
+                    results.append(SearchResult(type="chat_prompt", **row._mapping))
+            if kind in ("all", "chat_responses"):
+                for row in await db.execute(search_chat_responses(order), params):
+                    results.append(SearchResult(type="chat_response", **row._mapping))
+        except OperationalError as e:
+            if "no such table" in str(e):
+                raise HTTPException(status_code=501, detail="Search is not available, SQLite was built without FTS5")
+            raise HTTPException(status_code=400, detail=f"Invalid search query: {e.orig}")
+
+    if order == "rank":
+        results.sort(key=lambda r: r.rank)
+    return results[:limit]
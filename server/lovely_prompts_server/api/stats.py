@@ -0,0 +1,125 @@
+from typing import Dict, List, Literal, Optional, Tuple
+from datetime import datetime
+
+from fastapi import APIRouter, Depends, Query, Request
+
+from sqlalchemy import text
+
+from lovely_prompts_server.common import TAG_WEBAPP
+from lovely_prompts_server.models import StatsRow
+from lovely_prompts_server.db.session import get_session, check_project_exists
+from lovely_prompts_server.db.pagination import db_timestamp
+from lovely_prompts_server.db.stats import BUCKETS, STATS_COLUMNS
+
+
+router = APIRouter()
+
+
+# Nearest-rank percentiles, computed from the responses themselves. This one is O(responses in the range).
+PERCENTILES = {"p50": 0.5, "p90": 0.9, "p99": 0.99}
+PERCENTILE_COLUMNS = ("tok_in", "tok_out", "ttft", "tok_per_sec")
+
+StatsGroup = Literal["model", "provider", "stop_reason"]
+Bucket = Literal["hour", "day", "week", "month"]
+
+
+def key_columns(group_by: List[str], bucket: Optional[str], created: str) -> List[Tuple[str, str]]:
+    """(name, SQL expression) for the columns to group by"""
+    columns = [("bucket", BUCKETS[bucket].format(col=created))] if bucket else []
+    return columns + [(group, group) for group in group_by]
+
+
+def rollup_query(group_by: List[str], bucket: Optional[str], where: str):
+    keys = key_columns(group_by, bucket, "bucket")
+    select = [f"{expr} AS {name}" for name, expr in keys] + ["sum(n) AS count"]
+    for column in STATS_COLUMNS:
+        select += [f"sum({column}_sum) AS {column}_sum", f"sum({column}_n) AS {column}_n"]
+    group = f"GROUP BY {', '.join(name for name, _ in keys)} ORDER BY {', '.join(name for name, _ in keys)}" if keys else ""
+    return text(f"SELECT {', '.join(select)} FROM chat_response_stats {where} {group}")
+
+
+def percentile_query(column: str, group_by: List[str], bucket: Optional[str], where: str):
+    keys = key_columns(group_by, bucket, "created")
+    names = ", ".join(name for name, _ in keys)
+    partition = f"PARTITION BY {names}" if keys else ""
+    base = ", ".join([f"{expr} AS {name}" for name, expr in keys if name == "bucket"] +
+                     [f"coalesce({expr}, '') AS {name}" for name, expr in keys if name != "bucket"] + [f"{column} AS v"])
+    where = f"{where} AND {column} IS NOT NULL" if where else f"WHERE {column} IS NOT NULL"
+    select = [f"{name}" for name, _ in keys] + [
+        f"min(CASE WHEN rn >= {q} * cnt THEN v END) AS {column}_{p}" for p, q in PERCENTILES.items()
+    ]
+    return text(
+        f"""
+        WITH ranked AS (
+            SELECT *, row_number() OVER ({partition} ORDER BY v) AS rn, count(*) OVER ({partition}) AS cnt
+            FROM (SELECT {base} FROM chat_responses {where})
+        )
+        SELECT {', '.join(select)} FROM ranked {f'GROUP BY {names}' if keys else ''}
+        """
+    )
+
+
+@router.get(
+    "/stats/",
+    response_model=List[StatsRow],
+    response_model_exclude_unset=True,
+    dependencies=[Depends(check_project_exists)],
+    tags=[TAG_WEBAPP],
+)
+async def get_stats(
+    request: Request,
+    project: str = "default",
+    group_by: List[StatsGroup] = Query([]),
+    bucket: Optional[Bucket] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    percentiles: bool = False,
+):
+    """Response counts, token usage and streaming latency, grouped by any of model, provider and stop_reason,
+    and by time bucket. The latency is measured by the server on the streamed responses, see StreamTiming.
+
+    Counts, sums and averages come from an hourly rollup, so since/until have hour precision for them.
+    `percentiles=true` adds p50/p90/p99 of tok_in, tok_out, ttft and tok_per_sec,
+    those scan the responses in the range."""
+    group_by = list(dict.fromkeys(group_by))
+
+    rollup_where, raw_where, params = [], [], {}
+    if since is not None:
+        params["since"] = db_timestamp(since)
+        params["since_hour"] = params["since"][:13] + ":00:00"
+        rollup_where.append("bucket >= :since_hour")
+        raw_where.append("created >= :since")
+    if until is not None:
+        params["until"] = db_timestamp(until)
+        rollup_where.append("bucket < :until")
+        raw_where.append("created < :until")
+    rollup_where = f"WHERE {' AND '.join(rollup_where)}" if rollup_where else ""
+    raw_where = f"WHERE {' AND '.join(raw_where)}" if raw_where else ""
+
+    keys = ["bucket"] * bool(bucket) + group_by
+    results: Dict[tuple, StatsRow] = {}
+
+    async with get_session(request=request, project=project) as db:
+        for row in (await db.execute(rollup_query(group_by, bucket, rollup_where), params)).mappings():
+            if not row["count"]:
+                continue  # Without GROUP BY, an empty range still gives one row of NULLs
+            stats = {key: row[key] or None for key in keys}  # '' stands for NULL in the rollup
+            stats["count"] = row["count"]
+            for column in STATS_COLUMNS:
+                if f"{column}_sum" in StatsRow.model_fields:
+                    stats[f"{column}_sum"] = row[f"{column}_sum"]
+                stats[f"{column}_avg"] = row[f"{column}_sum"] / row[f"{column}_n"] if row[f"{column}_n"] else None
+            results[tuple(row[key] for key in keys)] = StatsRow(**stats)
+
+        if percentiles:
+            for column in PERCENTILE_COLUMNS:
+                query = percentile_query(column, group_by, bucket, raw_where)
+                for row in (await db.execute(query, params)).mappings():
+                    stats = results.get(tuple(row[key] for key in keys))
+                    if stats is None:
+                        continue  # On the edge of the since/until hour
+                    if stats.percentiles is None:
+                        stats.percentiles = {}
+                    stats.percentiles.update({f"{column}_{p}": row[f"{column}_{p}"] for p in PERCENTILES})
+
+    return list(results.values())
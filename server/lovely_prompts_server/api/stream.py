@@ -0,0 +1,110 @@
+from typing import Dict, Optional, Set, Tuple
+
+import asyncio
+import logging
+
+import fastapi
+from sqlalchemy import select
+
+from lovely_prompts_server.common import UpdateEvents
+from lovely_prompts_server.metrics import metrics
+from lovely_prompts_server.models import WSMessage
+from lovely_prompts_server.db.session import get_session
+from lovely_prompts_server.streaming import StreamBuffer, stream_updates
+from lovely_prompts_server.ws_protocol import WS_COMPACT_PROTOCOL, decode_deltas, decode_mux_frame, encode_mux_error
+from lovely_prompts_server.api.chat_responses import CHAT_RESPONSES
+from lovely_prompts_server.api.completion_responses import COMPLETION_RESPONSES
+
+log = logging.getLogger(__name__)
+
+router = fastapi.APIRouter()
+
+
+@router.websocket("/stream/")
+async def multiplexed_stream(websocket: fastapi.WebSocket, project: str = "default"):
+    """Stream into any number of responses in the project, chat and completion, over one connection.
+
+    Compact protocol only, the frames carry the response ids, see ws_protocol.py.
+    Each response gets its own buffer, checkpointed like with /chat_responses/{id}/update_stream/.
+    An error in one response, like an unknown id or a bad update, only drops that one. The client gets an error
+    frame for it, the other responses keep streaming."""
+    if WS_COMPACT_PROTOCOL not in websocket.scope.get("subprotocols", []):
+        raise fastapi.WebSocketException(
+            code=fastapi.status.WS_1002_PROTOCOL_ERROR, reason=f"Use the {WS_COMPACT_PROTOCOL} subprotocol"
+        )
+    await websocket.accept(subprotocol=WS_COMPACT_PROTOCOL)
+
+    streams: Dict[str, Tuple[StreamBuffer, str, UpdateEvents]] = {}  # response id -> (buffer, prompt id, event)
+    failed: Set[str] = set()  # Dropped after an error, the rest of their updates are ignored
+    metrics.stream_websockets.inc("stream")
+
+    async def open_stream(id: str, started: Optional[float]) -> Tuple[StreamBuffer, str, UpdateEvents]:
+        async with get_session(request=websocket, project=project) as db:
+            for entries in (CHAT_RESPONSES, COMPLETION_RESPONSES):
+                prompt_id = await db.scalar(select(entries.schema.prompt_id).where(entries.schema.id == id))
+                if prompt_id is not None:
+                    break
+        if prompt_id is None:
+            raise ValueError(f"Response {id} not found")
+        streams[id] = (StreamBuffer(entries.schema, id, started=started), prompt_id, entries.stream_event)
+        return streams[id]
+
+    async def drop_stream(id: str, reason: str):
+        log.warning("Stream into %s failed: %s", id, reason)
+        failed.add(id)
+        if id in streams:
+            # Keep what was streamed before the error.
+            stream, _, _ = streams.pop(id)
+            await stream.close(websocket, project)
+        await websocket.send_text(encode_mux_error(id, reason[:500]))
+
+    async def flush_due():
+        for stream, _, _ in streams.values():
+            if stream.time_to_flush() == 0:
+                await stream.flush(websocket, project)
+
+    try:
+        while True:
+            due = [t for stream, _, _ in streams.values() if (t := stream.time_to_flush()) is not None]
+            try:
+                frame = await asyncio.wait_for(websocket.receive(), timeout=min(due, default=None))
+            except asyncio.TimeoutError:
+                await flush_due()
+                continue
+            if frame["type"] == "websocket.disconnect":
+                break
+
+            try:
+                groups = decode_mux_frame(frame["text"] if frame.get("text") is not None else frame.get("bytes"))
+            except ValueError as e:
+                raise fastapi.WebSocketException(code=fastapi.status.WS_1002_PROTOCOL_ERROR, reason=str(e)[:120])
+
+            for id, deltas, started in groups:
+                if deltas is None:
+                    # The client is done with this one.
+                    failed.discard(id)
+                    if id in streams:
+                        stream, _, _ = streams.pop(id)
+                        await stream.close(websocket, project)
+                    continue
+                if id in failed:
+                    continue
+
+                try:
+                    stream, prompt_id, event = streams.get(id) or await open_stream(id, started)
+                    messages = [
+                        WSMessage.model_construct(id=id, prompt_id=prompt_id, action=action, key=key, value=value)
+                        for action, key, value in decode_deltas(deltas)
+                    ]
+                    stream_updates(websocket.app, project, stream, messages, event)
+                except ValueError as e:
+                    await drop_stream(id, str(e))
+
+            await flush_due()
+    except fastapi.WebSocketDisconnect:
+        pass
+    finally:
+        # Save what's left, also if the streams were cut short.
+        metrics.stream_websockets.dec("stream")
+        for stream, _, _ in streams.values():
+            await stream.close(websocket, project)
@@ -1,8 +1,6 @@
 
 from sse_starlette.sse import EventSourceResponse
-import json
 
-from fastapi.encoders import jsonable_encoder
 import fastapi
 from fastapi import Depends, Request
 
@@ -17,25 +15,16 @@ router = fastapi.APIRouter()
 
 @router.get("/updates/", dependencies=[Depends(check_project_exists)], tags=[TAG_WEBAPP])
 async def get_updates(request: Request, project: str = "default") -> EventSourceResponse:
-    # event_queue = asyncio.Queue()
-    # event_queues[project].append(event_queue)
-
-    event_queue = append_event_queue(request.app, project=project)
+    subscriber = append_event_queue(request.app, project=project)
 
     async def event_generator():
-        print("Heartbeat start")
         try:
-            while True:
-                news = await event_queue.get()
-
-                payload = jsonable_encoder(dict(event=news["event"], data=news["data"]))
-                print("Sending event", payload)
+            async for payload in subscriber.events():
                 yield payload
-        except asyncio.CancelledError as e:
-            print("Heartbeat Cancelled", e)
+        except asyncio.CancelledError:
+            pass
         finally:
-            print("Heartbeat finally")
-            remove_event_queue(request.app, event_queue, project=project)
+            remove_event_queue(request.app, subscriber, project=project)
 
 
     return EventSourceResponse(event_generator())
@@ -1,20 +1,59 @@
+import logging
+import random
+import time
 
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.requests import Request
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
+from lovely_prompts_server.logs import LOG_BODY_MAX, LOG_SAMPLE
 
-class BodyLoggingMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        if request.method != "GET":
-            body = await request.body()
-            print(f"{request.url}: Raw Body: {body.decode()}")
 
-            # create a new stream for the body
-            async def mock_receive():
-                return {"type": "http.request", "body": body}
+log = logging.getLogger(__name__)
 
-            # replace the request's receive function with our mock one
-            request._receive = mock_receive
-        response = await call_next(request)
 
-        return response
+class BodyLoggingMiddleware:
+    """Log the requests with the start of their bodies. Plain ASGI, the body is passed through as it streams in."""
+
+    def __init__(self, app: ASGIApp, sample: float = LOG_SAMPLE, body_max: int = LOG_BODY_MAX):
+        self.app = app
+        self.sample = sample
+        self.body_max = body_max
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not log.isEnabledFor(logging.INFO) or random.random() >= self.sample:
+            await self.app(scope, receive, send)
+            return
+
+        body = bytearray()
+        size = 0
+        status = None
+
+        async def logged_receive() -> Message:
+            nonlocal size
+            message = await receive()
+            if message["type"] == "http.request":
+                chunk = message.get("body", b"")
+                size += len(chunk)
+                if len(body) < self.body_max:
+                    body.extend(chunk[: self.body_max - len(body)])
+            return message
+
+        async def logged_send(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, logged_receive, logged_send)
+        finally:
+            path = scope["path"] + (f"?{scope['query_string'].decode()}" if scope["query_string"] else "")
+            log.info(
+                "%s %s %s %.1fms body %d bytes%s",
+                scope["method"],
+                path,
+                status,
+                (time.perf_counter() - start) * 1000,
+                size,
+                f": {body.decode(errors='replace')}{'...' if size > len(body) else ''}" if body else "",
+            )
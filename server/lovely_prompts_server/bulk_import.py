@@ -0,0 +1,270 @@
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import json
+from datetime import datetime, timezone
+
+from pydantic import TypeAdapter, ValidationError
+from sqlalchemy import Table, insert
+from sqlalchemy.engine import Connection
+
+from lovely_prompts_server.db.local import (
+    ChatPromptSchema,
+    ChatResponseSchema,
+    CompletionPromptSchema,
+    CompletionResponseSchema,
+)
+from lovely_prompts_server.models import (
+    ChatPrompt,
+    ChatResponse,
+    CompletionPrompt,
+    CompletionResponse,
+    ImportEntry,
+    ImportResult,
+    make_id,
+    prompt_hash,
+)
+
+
+# Bulk import from JSONL. Each line is one of
+#  - Our export format, {"type": "chat_prompt" | "chat_response" | "completion_prompt" | "completion_response",
+#    "entry": {...}}, see export.py.
+#  - An OpenAI chat completion dump, {"request": {"messages": [...], ...}, "response": {"choices": [...], ...}}.
+#    The response can also be in the Batch API output shape, {"custom_id": ..., "response": {"body": {...}}}.
+#    Those don't have the request, the prompt is left empty.
+#  - A chat transcript, {"messages": [...]}, as in the OpenAI fine-tuning files.
+#    The last message is the response if it's from the assistant.
+#
+# The rows are inserted with INSERT OR IGNORE, so importing the same file twice doesn't make duplicates.
+
+IMPORT_BATCH_SIZE = 5000
+IMPORT_MAX_ERRORS = 100  # Reported in the result, the rest are only counted
+
+# The entry types, in the order the tables are written. The prompts go first, the responses reference them.
+IMPORT_TABLES: Dict[str, Table] = {
+    "chat_prompt": ChatPromptSchema.__table__,
+    "completion_prompt": CompletionPromptSchema.__table__,
+    "chat_response": ChatResponseSchema.__table__,
+    "completion_response": CompletionResponseSchema.__table__,
+}
+# For make_id(), and the response type of each prompt type
+IMPORT_CLASSES = {
+    "chat_prompt": ChatPrompt,
+    "completion_prompt": CompletionPrompt,
+    "chat_response": ChatResponse,
+    "completion_response": CompletionResponse,
+}
+IMPORT_RESPONSES = {"chat_prompt": "chat_response", "completion_prompt": "completion_response"}
+
+PROMPT_COLUMNS = ChatPromptSchema.__table__.columns.keys()
+RESPONSE_COLUMNS = ChatResponseSchema.__table__.columns.keys()
+
+import_entry = TypeAdapter(ImportEntry)
+
+Row = Tuple[str, Dict[str, Any]]  # (entry type, row)
+Rows = Dict[str, List[dict]]  # entry type -> rows
+
+
+def _utc(dt: Optional[datetime]) -> Optional[datetime]:
+    """Naive UTC, like the CURRENT_TIMESTAMP the server writes. `created` is compared as text for the pagination,
+    an offset left in would sort the row wrong. Naive datetimes are taken as UTC already."""
+    if dt is not None and dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+
+def _row(columns, data: dict, now: datetime) -> Dict[str, Any]:
+    # All rows get all the columns, so the whole batch is one executemany.
+    row = dict.fromkeys(columns) | data
+    row["created"] = _utc(row["created"]) or now
+    row["updated"] = _utc(row["updated"]) or row["created"]
+    row["synced"] = bool(row["synced"])
+    return row
+
+
+def _timestamp(ts) -> datetime:
+    return datetime.fromtimestamp(ts, timezone.utc).replace(tzinfo=None)
+
+
+def entry_rows(obj: dict, now: datetime) -> Iterator[Row]:
+    entry = import_entry.validate_python(obj).entry
+    kind = obj["type"]
+    if kind in IMPORT_RESPONSES:
+        prompt = _row(IMPORT_TABLES[kind].columns.keys(), entry.model_dump(exclude={"responses"}), now)
+        prompt["id"] = prompt["id"] or make_id(IMPORT_CLASSES[kind])
+        prompt["prompt_hash"] = prompt_hash(prompt["prompt"])  # Don't trust the one in the file
+        yield kind, prompt
+        response_kind = IMPORT_RESPONSES[kind]
+        for response in entry.responses:
+            data = _row(IMPORT_TABLES[response_kind].columns.keys(), response.model_dump(), now)
+            data |= {"id": response.id or make_id(IMPORT_CLASSES[response_kind]), "prompt_id": prompt["id"]}
+            yield response_kind, data
+    else:
+        if entry.prompt_id is None:
+            raise ValueError(f"{kind} needs a prompt_id")
+        response = _row(IMPORT_TABLES[kind].columns.keys(), entry.model_dump(), now)
+        response["id"] = response["id"] or make_id(IMPORT_CLASSES[kind])
+        yield kind, response
+
+
+def openai_rows(obj: dict, now: datetime) -> Iterator[Row]:
+    request = obj.get("request") or {}
+    completion = obj.get("response") or {}
+    completion = completion.get("body", completion)  # Batch API output
+
+    messages = list(request.get("messages") or obj.get("messages") or [])
+    choices = completion.get("choices") or []
+    if not choices and messages and messages[-1].get("role") == "assistant":
+        choices = [{"message": messages.pop(), "finish_reason": None}]
+    if not messages and not choices:
+        raise ValueError("No messages and no response")
+
+    created = _timestamp(completion["created"]) if completion.get("created") else now
+    messages = [{"role": m.get("role"), "content": _text(m.get("content"))} for m in messages]
+    prompt = _row(
+        PROMPT_COLUMNS,
+        {"id": make_id(ChatPrompt), "prompt": messages, "prompt_hash": prompt_hash(messages), "created": created},
+        now,
+    )
+    yield "chat_prompt", prompt
+
+    usage = completion.get("usage") or {}
+    meta = {"openai_id": completion.get("id"), "custom_id": obj.get("custom_id")}
+    for choice in choices:
+        message = choice.get("message") or {}
+        data = {
+            "id": make_id(ChatResponse),
+            "prompt_id": prompt["id"],
+            "role": message.get("role", "assistant"),
+            "content": _text(message.get("content")),
+            "stop_reason": choice.get("finish_reason"),
+            "tok_in": usage.get("prompt_tokens"),
+            "tok_out": usage.get("completion_tokens") if len(choices) == 1 else None,
+            "tok_max": request.get("max_tokens") or request.get("max_completion_tokens"),
+            "model": completion.get("model") or request.get("model"),
+            "temperature": request.get("temperature"),
+            "provider": "openai" if completion or request else None,
+            "meta": {key: value for key, value in meta.items() if value is not None} or None,
+            "created": created,
+        }
+        yield "chat_response", _row(RESPONSE_COLUMNS, data, now)
+
+
+def _text(content) -> str:
+    """Message content can also be a list of parts, keep the text ones."""
+    if content is None or isinstance(content, str):
+        return content
+    return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+
+
+def line_rows(line: str, now: datetime) -> Iterator[Row]:
+    obj = json.loads(line)
+    if not isinstance(obj, dict):
+        raise ValueError("Expected a JSON object")
+    if "type" in obj and "entry" in obj:
+        return entry_rows(obj, now)
+    return openai_rows(obj, now)
+
+
+def insert_rows(connection: Connection, rows: Rows) -> Dict[str, int]:
+    """Returns the number of rows actually inserted by type, the ones that already exist are skipped."""
+    counts = {}
+    for kind, table in IMPORT_TABLES.items():
+        if rows.get(kind):
+            counts[kind] = connection.execute(insert(table).prefix_with("OR IGNORE"), rows[kind]).rowcount
+    return counts
+
+
+class LineSplitter:
+    """Splits a body into lines as the chunks arrive. A line that spans chunks is kept as a list of its parts,
+    so a long one costs O(length), not a copy of everything so far for every chunk."""
+
+    def __init__(self):
+        self._partial: List[bytes] = []
+
+    def feed(self, chunk: bytes) -> List[str]:
+        *lines, rest = chunk.split(b"\n")
+        if lines:
+            lines[0] = b"".join(self._partial + [lines[0]])
+            self._partial = []
+        if rest:
+            self._partial.append(rest)
+        return [line.decode() for line in lines]
+
+    def rest(self) -> str:
+        """The last line, if the body doesn't end with a newline."""
+        line = b"".join(self._partial).decode()
+        self._partial = []
+        return line
+
+
+class Importer:
+    """Parses the lines into batches of rows. The caller writes the batches and collects the totals."""
+
+    def __init__(self, batch_size=IMPORT_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.result = ImportResult()
+        self.rows: Rows = {kind: [] for kind in IMPORT_TABLES}
+        self._size = 0
+        self._line = 0
+
+    def add_line(self, line: str) -> bool:
+        """Returns True when a batch is ready to be written."""
+        self._line += 1
+        line = line.strip()
+        if not line:
+            return False
+
+        try:
+            # Parse the whole line before adding anything, so a bad line leaves nothing behind.
+            rows = list(line_rows(line, datetime.now(timezone.utc).replace(tzinfo=None)))
+        except (ValueError, KeyError, TypeError, AttributeError, ValidationError) as e:
+            self.result.failed += 1
+            if len(self.result.errors) < IMPORT_MAX_ERRORS:
+                self.result.errors.append(f"Line {self._line}: {e}")
+            return False
+
+        for kind, row in rows:
+            self.rows[kind].append(row)
+        self._size += len(rows)
+        return self._size >= self.batch_size
+
+    def add_lines(self, lines: Iterable[str]) -> bool:
+        ready = False
+        for line in lines:
+            ready = self.add_line(line) or ready
+        return ready
+
+    def take(self) -> Tuple[Rows, int]:
+        """The rows parsed so far, and how many there are."""
+        batch, size = self.rows, self._size
+        self.rows = {kind: [] for kind in IMPORT_TABLES}
+        self._size = 0
+        return batch, size
+
+    def written(self, counts: Dict[str, int]):
+        for kind, n in counts.items():
+            setattr(self.result, f"{kind}s", getattr(self.result, f"{kind}s") + n)
+
+
+def import_lines(
+    connection: Connection, lines: Iterable[str], batch_size=IMPORT_BATCH_SIZE, commit_every=100_000
+) -> ImportResult:
+    """Import into a sync connection, committing every `commit_every` rows."""
+    importer = Importer(batch_size)
+    uncommitted = 0
+
+    def write():
+        nonlocal uncommitted
+        rows, size = importer.take()
+        importer.written(insert_rows(connection, rows))
+        uncommitted += size
+        if uncommitted >= commit_every:
+            connection.commit()
+            uncommitted = 0
+
+    for line in lines:
+        if importer.add_line(line):
+            write()
+    write()
+    connection.commit()
+    return importer.result
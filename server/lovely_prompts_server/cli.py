@@ -0,0 +1,141 @@
+import argparse
+import sys
+import time
+from pathlib import Path
+
+from lovely_prompts_server.bulk_import import IMPORT_BATCH_SIZE, import_lines
+from lovely_prompts_server.db.compression import compress_rows
+from lovely_prompts_server.db.fts import drop_fts, ensure_fts
+from lovely_prompts_server.db.local import Base
+from lovely_prompts_server.db.migrate import drop_derived, migrate
+from lovely_prompts_server.db.session import project_create, project_db_path, project_engine
+from lovely_prompts_server.export import EXPORT_TABLES, export_project
+
+
+def cmd_export(args):
+    if not project_db_path(args.project).exists():
+        sys.exit(f"Project '{args.project}' not found at {project_db_path(args.project)}")
+
+    engine = project_engine(args.project)
+    out = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        with engine.connect() as connection:
+            for chunk in export_project(connection, args.format, args.table):
+                out.write(chunk)
+    except RuntimeError as e:
+        sys.exit(str(e))
+    finally:
+        if args.output:
+            out.close()
+        engine.dispose()
+
+
+def cmd_import(args):
+    start = time.perf_counter()
+    engine = project_create(args.project)
+    lines = sys.stdin if args.file == "-" else open(args.file, encoding="utf-8")
+    try:
+        with engine.connect() as connection:
+            if not args.keep_indexes:
+                drop_derived(connection)
+                connection.commit()
+            try:
+                result = import_lines(connection, lines, batch_size=args.batch_size)
+            finally:
+                if not args.keep_indexes:
+                    print("Rebuilding the indexes", file=sys.stderr)
+                    migrate(connection)
+                    connection.commit()
+    finally:
+        if lines is not sys.stdin:
+            lines.close()
+        engine.dispose()
+
+    for error in result.errors:
+        print(error, file=sys.stderr)
+    completions = ""
+    if result.completion_prompts or result.completion_responses:
+        completions = f", {result.completion_prompts} completion prompts and {result.completion_responses} responses"
+    print(
+        f"Imported {result.chat_prompts} prompts and {result.chat_responses} responses{completions} "
+        f"in {time.perf_counter() - start:.1f}s, {result.failed} lines failed",
+        file=sys.stderr,
+    )
+
+
+def _db_size(project: str) -> int:
+    path = project_db_path(project)
+    return sum(p.stat().st_size for p in (path, Path(f"{path}-wal")) if p.exists())
+
+
+def cmd_compact(args):
+    if not project_db_path(args.project).exists():
+        sys.exit(f"Project '{args.project}' not found at {project_db_path(args.project)}")
+
+    start = time.perf_counter()
+    size = _db_size(args.project)
+    engine = project_create(args.project)  # Brings the schema up to date first
+    try:
+        with engine.connect() as connection:
+            # Every rewritten body would be re-indexed, it's faster to index them all once at the end.
+            drop_fts(connection)
+            rows = sum(compress_rows(connection, table) for table in Base.metadata.sorted_tables)
+            connection.commit()
+
+        # VACUUM can't run in a transaction.
+        with engine.execution_options(isolation_level="AUTOCOMMIT").connect() as connection:
+            connection.exec_driver_sql("VACUUM")
+            connection.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+
+        # VACUUM can renumber the rowids, the search index has to be built after it.
+        with engine.begin() as connection:
+            ensure_fts(connection)
+    finally:
+        engine.dispose()
+
+    print(
+        f"Compressed {rows} rows, {size / 2**20:.1f}MB -> {_db_size(args.project) / 2**20:.1f}MB "
+        f"in {time.perf_counter() - start:.1f}s",
+        file=sys.stderr,
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="lovely-prompts-server", description="Lovely Prompts server tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export = commands.add_parser("export", help="Export a project as JSONL, Parquet or Arrow")
+    export.add_argument("project")
+    export.add_argument("-o", "--output", help="Output file, stdout by default")
+    export.add_argument("-f", "--format", choices=["jsonl", "parquet", "arrow"], default="jsonl")
+    export.add_argument(
+        "-t", "--table", choices=list(EXPORT_TABLES), default="chat_responses",
+        help="Parquet and Arrow only, JSONL has all of them",
+    )
+    export.set_defaults(func=cmd_export)
+
+    imp = commands.add_parser(
+        "import", help="Import JSONL, our export or OpenAI chat completion dumps. The project is created if needed"
+    )
+    imp.add_argument("project")
+    imp.add_argument("file", help="JSONL file, - for stdin")
+    imp.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    imp.add_argument(
+        "--keep-indexes", action="store_true",
+        help="Keep the indexes and the search index updated while importing. "
+        "Slower, but safe while the server is writing to the same project",
+    )
+    imp.set_defaults(func=cmd_import)
+
+    compact = commands.add_parser(
+        "compact", help="Compress the large bodies stored uncompressed, and VACUUM. Stop the server first"
+    )
+    compact.add_argument("project")
+    compact.set_defaults(func=cmd_compact)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -24,3 +24,8 @@ class UpdateEvents(Enum):
 
     STREAM_CHAT_RESPONSE = "stream_chr"
     STREAM_COMPLETION_RESPONSE = "stream_cop"
+
+    NEW_BATCH = "new_batch"
+
+    # The webapp fell behind and some updates were dropped, it should reload.
+    RESYNC = "resync"
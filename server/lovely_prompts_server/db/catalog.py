@@ -0,0 +1,75 @@
+from typing import Callable, List, Optional, Set
+
+import logging
+import os
+import threading
+
+
+log = logging.getLogger(__name__)
+
+
+class ProjectCatalog:
+    """In-memory set of projects, so resolving a project on the hot path is a set lookup and no syscalls.
+
+    It's kept up to date by project create/delete, and optionally by a watcher that notices
+    project files added or removed by hand."""
+
+    def __init__(self, dbs_dir: str):
+        self.dbs_dir = dbs_dir
+        self._projects: Set[str] = set()
+        self._lock = threading.Lock()  # Writers only, readers see either the old or the new set
+        self._dir_mtime = None
+        self._watcher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.refresh()
+
+    def __contains__(self, project: str) -> bool:
+        return project in self._projects
+
+    def list(self) -> List[str]:
+        return sorted(self._projects)
+
+    def add(self, project: str):
+        with self._lock:
+            self._projects = self._projects | {project}
+
+    def discard(self, project: str):
+        with self._lock:
+            self._projects = self._projects - {project}
+
+    def refresh(self) -> Set[str]:
+        """Re-read the project list from disk. Returns the projects that disappeared."""
+        os.makedirs(self.dbs_dir, exist_ok=True)
+        with self._lock:
+            self._dir_mtime = os.stat(self.dbs_dir).st_mtime_ns
+            # Skip the -wal and -shm files that SQLite keeps next to the DB.
+            projects = {name[: -len(".db")] for name in os.listdir(self.dbs_dir) if name.endswith(".db")}
+            removed = self._projects - projects
+            self._projects = projects
+        return removed
+
+    def watch(self, interval: float = 2.0, on_removed: Optional[Callable[[str], None]] = None):
+        """Poll the directory mtime, and re-read the project list when it changes."""
+        if self._watcher is not None:
+            return
+
+        def _watch():
+            while not self._stop.wait(interval):
+                try:
+                    if os.stat(self.dbs_dir).st_mtime_ns == self._dir_mtime:
+                        continue
+                    for project in self.refresh():
+                        log.info("Project '%s' was removed", project)
+                        if on_removed is not None:
+                            on_removed(project)
+                except OSError as e:
+                    log.warning("Failed to refresh the project list: %s", e)
+
+        self._watcher = threading.Thread(target=_watch, name="lovely-prompts-projects", daemon=True)
+        self._watcher.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join()
+            self._watcher = None
@@ -1,6 +1,8 @@
 from sqlalchemy import Column, ForeignKey, Integer, String, JSON, Float, DateTime, func, Boolean
 from sqlalchemy.orm import declarative_base, relationship
 
+from .compression import CompressedText
+
 # Base = declarative_base()
 
 
@@ -17,11 +19,15 @@ class EntryMeta:
     created = Column(DateTime(timezone=True), default=func.now())
     updated = Column(DateTime(timezone=True), default=func.now(), onupdate=func.now())
 
+    # Fetch the SQL-generated timestamps with RETURNING on flush. The API runs on AsyncSession,
+    # where reading an expired attribute later would need IO.
+    __mapper_args__ = {"eager_defaults": True}
+
 
 class ResponseMeta:
     """Common fields for ChatResponse and CompletionResponse."""
 
-    content = Column(String)
+    content = Column(CompressedText)  # Compressed when large, see compression.py
     stop_reason = Column(String)
 
     tok_in = Column(Integer)
@@ -31,3 +37,12 @@ class ResponseMeta:
     temperature = Column(Float)
     provider = Column(String)
     meta = Column(JSON)
+
+    # Measured by the server while the response streams in, see streaming.StreamTiming. Durations in seconds.
+    stream_start = Column(DateTime(timezone=True))
+    ttft = Column(Float)  # From stream_start to the first content
+    stream_time = Column(Float)  # From stream_start to the last content
+    gap_p50 = Column(Float)  # Between the content updates
+    gap_p90 = Column(Float)
+    gap_p99 = Column(Float)
+    tok_per_sec = Column(Float)
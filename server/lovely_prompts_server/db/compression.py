@@ -0,0 +1,88 @@
+from typing import Optional, Union
+
+import json
+import zlib
+
+from sqlalchemy import JSON, String, Table
+from sqlalchemy.engine import Connection
+from sqlalchemy.types import TypeDecorator
+
+
+# The prompt and response bodies above COMPRESS_MIN_SIZE are stored zlib-compressed, as BLOBs.
+# Smaller ones stay TEXT, compressing them doesn't pay. In these columns a BLOB is always compressed,
+# and TEXT never is, so the rows written before this, or by streaming, read back fine.
+#
+# SQL that reads the bodies has to go through lp_text(), the search index triggers do.
+# The functions are registered on every connection the server makes, see session.py.
+# A plain sqlite3 shell doesn't have them, it can read the tables but can't write the bodies.
+
+COMPRESS_MIN_SIZE = 2048  # Bytes of UTF-8
+COMPRESS_LEVEL = 6
+
+
+def compress_text(value: str) -> Union[str, bytes]:
+    data = value.encode()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return value
+    compressed = zlib.compress(data, COMPRESS_LEVEL)
+    # Keep the text if it barely compresses, reading it is cheaper.
+    return compressed if len(compressed) < len(data) * 0.9 else value
+
+
+def decompress_text(value: Union[str, bytes, None]) -> Optional[str]:
+    if isinstance(value, bytes):
+        return zlib.decompress(value).decode()
+    return value
+
+
+def _sql_compress(value):
+    return compress_text(value) if isinstance(value, str) else value
+
+
+def register_sqlite_functions(dbapi_connection, connection_record):
+    dbapi_connection.create_function("lp_text", 1, decompress_text, deterministic=True)
+    dbapi_connection.create_function("lp_compress", 1, _sql_compress, deterministic=True)
+
+
+class CompressedText(TypeDecorator):
+    impl = String
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        # Streaming can replace the content with a number or a bool, store those as is.
+        return compress_text(value) if isinstance(value, str) else value
+
+    def process_result_value(self, value, dialect):
+        return decompress_text(value)
+
+
+class CompressedJSON(TypeDecorator):
+    """Like JSON, and the same DDL. Does the (de)serialization itself, the result of compression is not JSON."""
+
+    impl = JSON
+    cache_ok = True
+
+    def bind_processor(self, dialect):
+        def process(value):
+            return None if value is None else compress_text(json.dumps(value))
+
+        return process
+
+    def result_processor(self, dialect, coltype):
+        def process(value):
+            return None if value is None else json.loads(decompress_text(value))
+
+        return process
+
+
+def compress_rows(connection: Connection, table: Table) -> int:
+    """Compress the bodies stored as TEXT that are over the size limit. Returns the number of rows rewritten."""
+    n = 0
+    for column in table.columns:
+        if isinstance(column.type, (CompressedText, CompressedJSON)):
+            n += connection.exec_driver_sql(
+                f"UPDATE {table.name} SET {column.name} = lp_compress({column.name}) "
+                f"WHERE typeof({column.name}) = 'text' AND length(CAST({column.name} AS BLOB)) >= ?",
+                (COMPRESS_MIN_SIZE,),
+            ).rowcount
+    return n
@@ -0,0 +1,116 @@
+import logging
+
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import OperationalError
+
+
+log = logging.getLogger(__name__)
+
+
+# Full-text search, with SQLite FTS5. The FTS rows share the rowid with the rows they index,
+# and triggers keep them in sync, so everything that writes to the tables is covered, the API, batches and the CLI.
+#
+# Responses are indexed with an external content table, the text is not stored twice. It reads the text through
+# a view, the large bodies are compressed (see compression.py).
+# Prompts keep their own copy of the message contents, FTS5 can't read them out of the JSON column.
+#
+# Implicit rowids can change on VACUUM, call rebuild_fts() after it.
+
+FTS_TOKENIZE = "porter unicode61 remove_diacritics 2"
+
+# Matches in the title count more than in the body.
+FTS_RANK = "bm25(4.0, 2.0, 1.0)"
+
+
+def prompt_messages(row: str) -> str:
+    """SQL for the text of all messages in a chat prompt, one per line."""
+    return f"(SELECT group_concat(json_extract(value, '$.content'), char(10)) FROM json_each(lp_text({row}.prompt)))"
+
+
+FTS_DDL = [
+    # Prompts
+    f"""CREATE VIRTUAL TABLE chat_prompts_fts USING fts5(title, comment, messages, tokenize='{FTS_TOKENIZE}')""",
+    f"""INSERT INTO chat_prompts_fts(chat_prompts_fts, rank) VALUES ('rank', '{FTS_RANK}')""",
+    f"""CREATE TRIGGER chat_prompts_fts_insert AFTER INSERT ON chat_prompts BEGIN
+        INSERT INTO chat_prompts_fts(rowid, title, comment, messages)
+        VALUES (new.rowid, new.title, new.comment, {prompt_messages("new")});
+    END""",
+    f"""CREATE TRIGGER chat_prompts_fts_update AFTER UPDATE OF title, comment, prompt ON chat_prompts BEGIN
+        DELETE FROM chat_prompts_fts WHERE rowid = old.rowid;
+        INSERT INTO chat_prompts_fts(rowid, title, comment, messages)
+        VALUES (new.rowid, new.title, new.comment, {prompt_messages("new")});
+    END""",
+    """CREATE TRIGGER chat_prompts_fts_delete AFTER DELETE ON chat_prompts BEGIN
+        DELETE FROM chat_prompts_fts WHERE rowid = old.rowid;
+    END""",
+    # Responses
+    """CREATE VIEW chat_responses_text AS
+        SELECT rowid, title, comment, lp_text(content) AS content FROM chat_responses""",
+    f"""CREATE VIRTUAL TABLE chat_responses_fts USING fts5(
+        title, comment, content, content='chat_responses_text', content_rowid='rowid', tokenize='{FTS_TOKENIZE}'
+    )""",
+    f"""INSERT INTO chat_responses_fts(chat_responses_fts, rank) VALUES ('rank', '{FTS_RANK}')""",
+    """CREATE TRIGGER chat_responses_fts_insert AFTER INSERT ON chat_responses BEGIN
+        INSERT INTO chat_responses_fts(rowid, title, comment, content)
+        VALUES (new.rowid, new.title, new.comment, lp_text(new.content));
+    END""",
+    """CREATE TRIGGER chat_responses_fts_update AFTER UPDATE OF title, comment, content ON chat_responses BEGIN
+        INSERT INTO chat_responses_fts(chat_responses_fts, rowid, title, comment, content)
+        VALUES ('delete', old.rowid, old.title, old.comment, lp_text(old.content));
+        INSERT INTO chat_responses_fts(rowid, title, comment, content)
+        VALUES (new.rowid, new.title, new.comment, lp_text(new.content));
+    END""",
+    """CREATE TRIGGER chat_responses_fts_delete AFTER DELETE ON chat_responses BEGIN
+        INSERT INTO chat_responses_fts(chat_responses_fts, rowid, title, comment, content)
+        VALUES ('delete', old.rowid, old.title, old.comment, lp_text(old.content));
+    END""",
+]
+
+
+FTS_TRIGGERS = [
+    f"chat_{table}_fts_{action}" for table in ("prompts", "responses") for action in ("insert", "update", "delete")
+]
+
+
+def rebuild_fts(connection: Connection):
+    """Re-index everything from scratch."""
+    connection.exec_driver_sql("DELETE FROM chat_prompts_fts")
+    connection.exec_driver_sql(
+        "INSERT INTO chat_prompts_fts(rowid, title, comment, messages) "
+        f"SELECT rowid, title, comment, {prompt_messages('chat_prompts')} FROM chat_prompts"
+    )
+    connection.exec_driver_sql("INSERT INTO chat_responses_fts(chat_responses_fts) VALUES ('rebuild')")
+
+
+def drop_fts(connection: Connection):
+    for name in FTS_TRIGGERS:
+        connection.exec_driver_sql(f"DROP TRIGGER IF EXISTS {name}")
+    connection.exec_driver_sql("DROP VIEW IF EXISTS chat_responses_text")
+    connection.exec_driver_sql("DROP TABLE IF EXISTS chat_prompts_fts")
+    connection.exec_driver_sql("DROP TABLE IF EXISTS chat_responses_fts")
+
+
+def ensure_fts(connection: Connection) -> bool:
+    """Create the search index if it's missing or out of date, and index the existing rows.
+    False if SQLite has no FTS5."""
+    # SQLite keeps the CREATE statements as they were written, any change to FTS_DDL shows up here.
+    created = [statement for statement in FTS_DDL if statement.startswith("CREATE")]
+    placeholders = ", ".join("?" * len(created))
+    current = connection.exec_driver_sql(
+        f"SELECT count(*) FROM sqlite_master WHERE sql IN ({placeholders})", tuple(created)
+    ).scalar()
+    if current == len(created):
+        return True
+    drop_fts(connection)
+
+    try:
+        for statement in FTS_DDL:
+            connection.exec_driver_sql(statement)
+    except OperationalError as e:
+        if "no such module" not in str(e):
+            raise
+        log.warning("SQLite was built without FTS5, search is disabled: %s", e)
+        return False
+
+    rebuild_fts(connection)
+    return True
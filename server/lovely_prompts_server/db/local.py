@@ -1,6 +1,7 @@
-from sqlalchemy import Column, Integer, JSON, String, ForeignKey
+from sqlalchemy import Column, Index, Integer, JSON, String, ForeignKey
 from sqlalchemy.orm import relationship, declarative_base
 from lovely_prompts_server.db.common import EntryMeta, ResponseMeta
+from lovely_prompts_server.db.compression import CompressedJSON, CompressedText
 
 
 Base = declarative_base()
@@ -18,45 +19,65 @@ Base = declarative_base()
 
 class ChatPromptSchema(Base, EntryMeta):
     __tablename__ = "chat_prompts"
+    # Newest first listing and keyset pagination
+    __table_args__ = (Index("ix_chat_prompts_created_id", "created", "id"),)
 
     # run_id = Column(String, ForeignKey("runs.id"), nullable=True)
     # run = relationship("RunSchema", back_populates="chat_prompts")
 
-    prompt = Column(JSON)
-    responses = relationship("ChatResponseSchema", back_populates="prompt", cascade="all, delete-orphan")
+    prompt = Column(CompressedJSON)
+    # models.prompt_hash() of the messages. Finds the identical prompts, and the responses to them.
+    prompt_hash = Column(String, index=True)
+    # Never lazy-load, a listing would run one query per prompt. Load it explicitly with selectinload().
+    responses = relationship(
+        "ChatResponseSchema", back_populates="prompt", cascade="all, delete-orphan", lazy="raise_on_sql"
+    )
 
 
 class ChatResponseSchema(Base, EntryMeta, ResponseMeta):
     __tablename__ = "chat_responses"
+    __table_args__ = (
+        Index("ix_chat_responses_created_id", "created", "id"),
+        # Latency over time per model, without reading the rows. Also finds the slowest calls.
+        Index("ix_chat_responses_model_created_ttft", "model", "created", "ttft"),
+    )
 
     # run_id = Column(String, ForeignKey("runs.id"), nullable=True)
     # run = relationship("RunSchema", back_populates="chat_responses")
 
-    prompt_id = Column(String, ForeignKey("chat_prompts.id"), nullable=False)
-    prompt = relationship("ChatPromptSchema", back_populates="responses")
+    prompt_id = Column(String, ForeignKey("chat_prompts.id"), nullable=False, index=True)
+    prompt = relationship("ChatPromptSchema", back_populates="responses", lazy="raise_on_sql")
 
     role = Column(String)  # "assistant" or similar
 
 
 class CompletionPromptSchema(Base, EntryMeta):
     __tablename__ = "completion_prompts"
+    __table_args__ = (Index("ix_completion_prompts_created_id", "created", "id"),)
 
     # run_id = Column(String, ForeignKey("runs.id"), nullable=True)
     # run = relationship("RunSchema", back_populates="completion_prompts")
 
-    prompt = Column(String)
+    prompt = Column(CompressedText)
+    prompt_hash = Column(String, index=True)  # Like in ChatPromptSchema
 
-    responses = relationship("CompletionResponseSchema", back_populates="prompt", cascade="all, delete-orphan")
+    responses = relationship(
+        "CompletionResponseSchema", back_populates="prompt", cascade="all, delete-orphan", lazy="raise_on_sql"
+    )
 
 
 class CompletionResponseSchema(Base, EntryMeta, ResponseMeta):
     __tablename__ = "completion_responses"
+    __table_args__ = (
+        Index("ix_completion_responses_created_id", "created", "id"),
+        Index("ix_completion_responses_model_created_ttft", "model", "created", "ttft"),
+    )
 
     # run_id = Column(String, ForeignKey("runs.id"), nullable=True)
     # run: RunSchema = relationship("RunSchema", back_populates="completion_responses")
 
-    prompt_id = Column(String, ForeignKey("completion_prompts.id"), nullable=False)
-    prompt = relationship("CompletionPromptSchema", back_populates="responses")
+    prompt_id = Column(String, ForeignKey("completion_prompts.id"), nullable=False, index=True)
+    prompt = relationship("CompletionPromptSchema", back_populates="responses", lazy="raise_on_sql")
 
 
 # class DBTemplate(Base, DBEntry):
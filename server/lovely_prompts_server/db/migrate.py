@@ -0,0 +1,65 @@
+import json
+
+from sqlalchemy.engine import Connection
+
+from lovely_prompts_server.models import prompt_hash
+
+from .local import Base
+from .fts import drop_fts, ensure_fts
+from .stats import drop_stats, ensure_stats
+
+
+# create_all() only creates missing tables. These bring the DBs created by older versions up to date.
+
+
+def ensure_columns(connection: Connection):
+    for table in Base.metadata.sorted_tables:
+        existing = {row[1] for row in connection.exec_driver_sql(f"PRAGMA table_info({table.name})")}
+        for column in table.columns:
+            if column.name not in existing:
+                type = column.type.compile(dialect=connection.dialect)
+                connection.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {type}")
+
+
+def ensure_prompt_hashes(connection: Connection, batch_size=1000):
+    """Hash the prompts written before the prompt_hash column existed."""
+    while True:
+        rows = connection.exec_driver_sql(
+            "SELECT id, lp_text(prompt) FROM chat_prompts "
+            "WHERE prompt_hash IS NULL AND coalesce(prompt, 'null') != 'null' LIMIT ?",
+            (batch_size,),
+        ).all()
+        if not rows:
+            return
+        connection.exec_driver_sql(
+            "UPDATE chat_prompts SET prompt_hash = ? WHERE id = ?",
+            [(prompt_hash(json.loads(prompt)), id) for id, prompt in rows],
+        )
+
+
+def ensure_indexes(connection: Connection):
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=connection, checkfirst=True)
+
+
+def migrate(connection: Connection):
+    ensure_columns(connection)
+    ensure_indexes(connection)
+    ensure_prompt_hashes(connection)
+    ensure_fts(connection)
+    ensure_stats(connection)
+
+
+def drop_derived(connection: Connection):
+    """Drop the secondary indexes, the search index, the stats rollup and their triggers.
+
+    For bulk loads, it's much faster to build them once at the end. migrate() puts them all back.
+    Nothing else should be writing to the DB in between, those writes would not be indexed.
+    Only our own triggers are dropped, migrate() could not recreate any others."""
+    drop_fts(connection)
+    drop_stats(connection)
+
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.drop(bind=connection, checkfirst=True)
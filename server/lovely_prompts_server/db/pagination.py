@@ -0,0 +1,78 @@
+from typing import Optional, Tuple
+
+import base64
+import binascii
+import json
+from datetime import datetime, timezone
+
+from fastapi import HTTPException
+from sqlalchemy import Select, String, desc, literal, tuple_, type_coerce
+
+
+# Keyset pagination over (created, id), newest first, backed by the (created, id) index.
+#
+# `created` is set by SQLite (CURRENT_TIMESTAMP, UTC), and is stored as text like "2024-01-01 12:00:00".
+# The comparisons are done on that raw text, a datetime bound from Python would be rendered
+# with microseconds and compare differently. `id` breaks the ties between rows created in the same second.
+
+CURSOR_HEADER = "X-Next-Cursor"
+
+
+def raw_created(schema):
+    return type_coerce(schema.created, String)
+
+
+def encode_cursor(created: str, id: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([created, id]).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    try:
+        created, id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not isinstance(created, str) or not isinstance(id, str):
+            raise ValueError(cursor)
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return created, id
+
+
+def db_timestamp(dt: datetime) -> str:
+    """Format a datetime the way SQLite stores CURRENT_TIMESTAMP. Naive datetimes are taken as UTC."""
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc)
+    return dt.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def paginate(
+    query: Select,
+    schema,
+    cursor: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    limit: int = 100,
+) -> Select:
+    """Add the raw `created` column, keyset filter, [since, until) range, order and limit to the query.
+
+    Use `next_cursor()` on the result rows to get the cursor for the next page."""
+    created = raw_created(schema)
+    query = query.add_columns(created.label("created_raw"))
+
+    if cursor:
+        cursor_created, cursor_id = decode_cursor(cursor)
+        query = query.where(
+            tuple_(created, schema.id) < tuple_(literal(cursor_created, String), literal(cursor_id, String))
+        )
+    if since is not None:
+        query = query.where(created >= literal(db_timestamp(since), String))
+    if until is not None:
+        query = query.where(created < literal(db_timestamp(until), String))
+
+    return query.order_by(desc(schema.created), desc(schema.id)).limit(limit)
+
+
+def next_cursor(rows: list, limit: int) -> Optional[str]:
+    """`rows` are (entry, raw created) rows from a `paginate()`d query. None if this was the last page."""
+    if len(rows) < limit or not rows:
+        return None
+    entry, created = rows[-1]
+    return encode_cursor(created, entry.id)
@@ -1,65 +1,190 @@
-from typing import Generator
+from typing import Generator, Dict, List
 
-from sqlalchemy.orm import Session, sessionmaker
 from starlette.requests import Request
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 
 from .local import Base
+from .catalog import ProjectCatalog
+from .compression import register_sqlite_functions
+from .migrate import migrate
+from ..metrics import metrics
 
 from fastapi import HTTPException
 
 
-from contextvars import ContextVar
+import appdirs
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
 
 
+log = logging.getLogger(__name__)
 
 
-import appdirs
-import os
-from pathlib import Path
+# Applied to every new connection. WAL lets the webapp read while the loggers write,
+# and with WAL synchronous=NORMAL can't corrupt the DB, it only skips the fsync on every commit.
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -64 * 1024,  # Negative means KiB, so 64MiB
+    "busy_timeout": 5000,  # ms to wait for a lock before giving up with SQLITE_BUSY
+}
 
 
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
 
 # I want to make it easy for the user to delete a project without knowing SQL or out CLI tools.
 # So each project is stored in a separate sqlite file, which can be just deleted.
+DBS_DIR = os.path.join(appdirs.user_data_dir("lovely_prompts"), "dbs")
+
 
-def project_exists(project):
-    app_data_dir = appdirs.user_data_dir("lovely_prompts")
-    sqlite_file = f"{app_data_dir}/dbs/{project}.db"
-    return os.path.exists(sqlite_file)
+def project_db_path(project: str) -> Path:
+    return Path(DBS_DIR) / f"{project}.db"
 
 
-def project_create(project: str):
-    app_data_dir = Path(appdirs.user_data_dir("lovely_prompts"))
-    sqlite_file = app_data_dir / "dbs" / f"{project}.db"
-    engine = create_engine(f"sqlite:///{sqlite_file}")
-    print(engine.url)
+def project_engine(project: str) -> Engine:
+    """Sync engine, for the CLI and the long-running jobs that run in a thread. The project must exist."""
+    engine = create_engine(f"sqlite:///{project_db_path(project)}")
+    event.listen(engine, "connect", set_sqlite_pragmas)
+    event.listen(engine, "connect", register_sqlite_functions)
+    return engine
+
+
+def project_create(project: str) -> Engine:
+    """Create the project DB and any missing tables. Returns a sync engine, for the CLI and maintenance."""
+    os.makedirs(DBS_DIR, exist_ok=True)
+
+    engine = project_engine(project)
 
-    if not project_exists(project):
-        print("Creating new database")
-        os.makedirs(app_data_dir / "dbs", exist_ok=True)
-        Base.metadata.create_all(bind=engine)
-    else:
-        print("Database already exists")
+    with engine.begin() as connection:
+        # Several server processes can open the same project at once. The others wait here,
+        # and then find the schema in place.
+        connection.exec_driver_sql("BEGIN EXCLUSIVE")
+        # Only creates the tables that don't exist yet.
+        Base.metadata.create_all(bind=connection)
+        migrate(connection)
+    log.info("Opened project '%s' at %s", project, engine.url)
 
     return engine
 
 
-def check_project_exists(project="default"):
-    if not project_exists(project):
-        raise HTTPException(status_code=404, detail=f"Project '{project}' not found")
+def project_async_engine(project: str) -> AsyncEngine:
+    """The engine the API uses. The project must exist."""
+    engine = create_async_engine(
+        f"sqlite+aiosqlite:///{project_db_path(project)}",
+        pool_size=16,
+        max_overflow=32,
+    )
+    event.listen(engine.sync_engine, "connect", set_sqlite_pragmas)
+    event.listen(engine.sync_engine, "connect", register_sqlite_functions)
+    return engine
+
+
+class MeteredSession(AsyncSession):
+    """Times the commits of the write sessions for /metrics. get_session() tags those with the project."""
+
+    async def commit(self):
+        project = self.info.get("project")
+        if project is None or not self.in_transaction():
+            return await super().commit()
+        start = time.perf_counter()
+        await super().commit()
+        metrics.sqlite_commit.observe(time.perf_counter() - start, project)
 
 
-def list_projects():
-    app_data_dir = appdirs.user_data_dir("lovely_prompts")
-    dbs_dir = f"{app_data_dir}/dbs"
-    os.makedirs(dbs_dir, exist_ok=True)
-    project_names = os.listdir(dbs_dir)
-    return [name.replace(".db", "") for name in project_names]
+def is_busy(e: OperationalError) -> bool:
+    code = getattr(e.orig, "sqlite_errorcode", None)
+    return code is not None and code & 0xFF == sqlite3.SQLITE_BUSY
 
 
-from contextlib import contextmanager
+def project_delete(project: str):
+    sqlite_file = project_db_path(project)
+    for path in (sqlite_file, Path(f"{sqlite_file}-wal"), Path(f"{sqlite_file}-shm")):
+        path.unlink(missing_ok=True)
+
+
+class EngineRegistry:
+    """One async engine and sessionmaker per project, created on first use and shared by all requests."""
+
+    def __init__(self, catalog: ProjectCatalog):
+        self.catalog = catalog
+        self._sessionmakers: Dict[str, async_sessionmaker] = {}
+        self._write_locks: Dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+        self._retired: List[AsyncEngine] = []
+        self._lock = asyncio.Lock()
+
+    async def sessionmaker(self, project: str) -> async_sessionmaker:
+        if self._retired:
+            await self._dispose_retired()
+
+        sm = self._sessionmakers.get(project)
+        if sm is None:
+            async with self._lock:
+                sm = self._sessionmakers.get(project)
+                if sm is None:
+                    # Creating the file and tables is blocking, keep it off the event loop.
+                    engine = await asyncio.to_thread(project_create, project)
+                    engine.dispose()
+
+                    # The objects are used after commit to build the responses, don't expire them.
+                    sm = async_sessionmaker(
+                        project_async_engine(project), class_=MeteredSession, expire_on_commit=False
+                    )
+                    self._sessionmakers[project] = sm
+                    self.catalog.add(project)
+        return sm
+
+    def write_lock(self, project: str) -> asyncio.Lock:
+        """SQLite has one writer at a time. Queueing the writers here is much cheaper than
+        having them poll in the SQLite busy handler."""
+        return self._write_locks[project]
+
+    def retire(self, project: str):
+        """Forget the project engine. Safe to call from any thread, the engine is closed on the event loop later."""
+        sm = self._sessionmakers.pop(project, None)
+        if sm is not None:
+            self._retired.append(sm.kw["bind"])
+
+    async def _dispose_retired(self):
+        while self._retired:
+            await self._retired.pop().dispose()
+
+    async def delete(self, project: str):
+        self.retire(project)
+        await self._dispose_retired()
+        await asyncio.to_thread(project_delete, project)
+        self.catalog.discard(project)
+
+    async def dispose_all(self):
+        for project in list(self._sessionmakers):
+            self.retire(project)
+        await self._dispose_retired()
+
+
+async def check_project_exists(request: Request, project="default"):
+    if project not in request.app.projects:
+        # Another server process might have just created it, the catalog only notices every few seconds.
+        if not project_db_path(project).exists():
+            raise HTTPException(status_code=404, detail=f"Project '{project}' not found")
+        request.app.projects.add(project)
+
+
+from contextlib import asynccontextmanager, nullcontext
 
 # This version create a new connection for every request, which is slow.
 # Use for debugging if you have to.
@@ -78,17 +203,25 @@ from contextlib import contextmanager
 # Don't use as a fastapi Dependency.
 # Deoendencies are cached by default, and end up being shaed between threads.
 # It's way too easy to forget use_cacehe=False and have a hard to find bug.
-@contextmanager
-def get_session(request: Request, project="default"):
-    thread_local_sm = request.app.sessionmakers.get()
-    if project not in thread_local_sm:
-        engine = project_create(project)
-        thread_local_sm[project] = sessionmaker(bind=engine)
-
-    db = thread_local_sm[project]()
-    try:
-        yield db
-    finally:
-        db.commit()
-        db.close()
-
+# Pass write=True if the session is going to write, and keep those sessions short.
+@asynccontextmanager
+async def get_session(request: Request, project="default", write=False) -> AsyncSession:
+    engines = request.app.engines
+    sm = await engines.sessionmaker(project)
+    start = time.perf_counter()
+    async with engines.write_lock(project) if write else nullcontext():
+        db = sm()
+        if write:
+            metrics.sqlite_write_wait.observe(time.perf_counter() - start, project)
+            db.info["project"] = project
+        try:
+            yield db
+            # Not on errors, committing after a failed flush would only replace the error with PendingRollbackError.
+            await db.commit()
+        except OperationalError as e:
+            # Only another process can hold the DB this long, our own writers queue on the lock above.
+            if write and is_busy(e):
+                metrics.sqlite_busy.inc(project)
+            raise
+        finally:
+            await db.close()
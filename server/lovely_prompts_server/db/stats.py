@@ -0,0 +1,104 @@
+from sqlalchemy.engine import Connection
+
+
+# Hourly rollup of the chat responses, per model, provider and stop reason.
+# Triggers keep it up to date on every write, so the /stats/ queries read O(buckets) rows, not O(responses).
+# NULLs are stored as '', so they can be part of the primary key.
+
+STATS_GROUPS = ("model", "provider", "stop_reason")
+# For each, a count of non-NULL values and their sum, of this SQL type.
+STATS_COLUMNS = {"tok_in": "INTEGER", "tok_out": "INTEGER", "tok_max": "INTEGER", "ttft": "REAL", "tok_per_sec": "REAL"}
+
+STATS_BUCKET = "coalesce(strftime('%Y-%m-%d %H:00:00', {row}.created), '')"
+
+# Coarser buckets are derived from the hour ones. Also used on the raw `created` values.
+BUCKETS = {
+    "hour": "strftime('%Y-%m-%d %H:00:00', {col})",
+    "day": "strftime('%Y-%m-%d', {col})",
+    "week": "strftime('%Y-W%W', {col})",
+    "month": "strftime('%Y-%m', {col})",
+}
+
+
+def _rollup_upsert(row: str, sign: str) -> str:
+    values = [STATS_BUCKET.format(row=row)]
+    values += [f"coalesce({row}.{group}, '')" for group in STATS_GROUPS]
+    values += [f"{sign}1"]
+    for column in STATS_COLUMNS:
+        values += [f"{sign}({row}.{column} IS NOT NULL)", f"{sign}coalesce({row}.{column}, 0)"]
+
+    updates = ["n = n + excluded.n"]
+    for column in STATS_COLUMNS:
+        updates += [f"{column}_n = {column}_n + excluded.{column}_n", f"{column}_sum = {column}_sum + excluded.{column}_sum"]
+
+    return (
+        f"INSERT INTO chat_response_stats VALUES ({', '.join(values)}) "
+        f"ON CONFLICT DO UPDATE SET {', '.join(updates)};"
+    )
+
+
+def _rollup_remove(row: str) -> str:
+    key = " AND ".join(
+        [f"bucket = {STATS_BUCKET.format(row=row)}"] + [f"{group} = coalesce({row}.{group}, '')" for group in STATS_GROUPS]
+    )
+    return _rollup_upsert(row, "-") + f"\n        DELETE FROM chat_response_stats WHERE {key} AND n = 0;"
+
+
+STATS_DDL = [
+    f"""CREATE TABLE IF NOT EXISTS chat_response_stats (
+        bucket TEXT NOT NULL,
+        {", ".join(f"{group} TEXT NOT NULL" for group in STATS_GROUPS)},
+        n INTEGER NOT NULL,
+        {", ".join(f"{col}_n INTEGER NOT NULL, {col}_sum {type} NOT NULL" for col, type in STATS_COLUMNS.items())},
+        PRIMARY KEY (bucket, {", ".join(STATS_GROUPS)})
+    ) WITHOUT ROWID""",
+    f"""CREATE TRIGGER chat_response_stats_insert AFTER INSERT ON chat_responses BEGIN
+        {_rollup_upsert("new", "")}
+    END""",
+    # The streaming checkpoints only touch `content`. Only the last one, with the timing, fires this.
+    f"""CREATE TRIGGER chat_response_stats_update
+    AFTER UPDATE OF created, {", ".join(STATS_GROUPS + tuple(STATS_COLUMNS))} ON chat_responses BEGIN
+        {_rollup_remove("old")}
+        {_rollup_upsert("new", "")}
+    END""",
+    f"""CREATE TRIGGER chat_response_stats_delete AFTER DELETE ON chat_responses BEGIN
+        {_rollup_remove("old")}
+    END""",
+]
+
+
+def rebuild_stats(connection: Connection):
+    """Recompute the rollup from the responses."""
+    groups = ", ".join(f"coalesce({group}, '')" for group in STATS_GROUPS)
+    sums = ", ".join(f"count({column}), coalesce(sum({column}), 0)" for column in STATS_COLUMNS)
+    connection.exec_driver_sql("DELETE FROM chat_response_stats")
+    connection.exec_driver_sql(
+        f"INSERT INTO chat_response_stats "
+        f"SELECT {STATS_BUCKET.format(row='chat_responses')} AS b, {groups}, count(*), {sums} "
+        f"FROM chat_responses GROUP BY b, {groups}"
+    )
+
+
+STATS_TRIGGERS = [f"chat_response_stats_{action}" for action in ("insert", "update", "delete")]
+
+
+def drop_stats(connection: Connection):
+    for name in STATS_TRIGGERS:
+        connection.exec_driver_sql(f"DROP TRIGGER IF EXISTS {name}")
+    connection.exec_driver_sql("DROP TABLE IF EXISTS chat_response_stats")
+
+
+def ensure_stats(connection: Connection):
+    exists = connection.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'chat_response_stats_insert'"
+    ).first()
+    columns = {row[1] for row in connection.exec_driver_sql("PRAGMA table_info(chat_response_stats)")}
+    if exists and all(f"{column}_sum" in columns for column in STATS_COLUMNS):
+        return
+
+    # Missing, or made by an older version with fewer columns. It's derived data, build it again.
+    drop_stats(connection)
+
+    for statement in STATS_DDL:
+        connection.exec_driver_sql(statement)
+    rebuild_stats(connection)
@@ -0,0 +1,255 @@
+from typing import Dict, List, Optional, Set
+
+import asyncio
+import json
+import logging
+import os
+from collections import defaultdict
+
+from lovely_prompts_server.common import UpdateEvents
+from lovely_prompts_server.event_queues import EventSubscriber
+from lovely_prompts_server.models import WSMessage
+
+
+log = logging.getLogger(__name__)
+
+
+# Where the update events go, see update_event_queues(). Configured from the environment, like the logs:
+#   LOVELY_PROMPTS_EVENT_BUS    "local", the default, for a single server process.
+#                               "unix:/path/to/events.sock" to pass the events between the processes, for
+#                               `uvicorn lovely_prompts_server.server:app --workers N`. All the workers need the
+#                               same path, and a path for each server if you run several on the same machine.
+EVENT_BUS = os.environ.get("LOVELY_PROMPTS_EVENT_BUS", "local")
+
+# A process that can't keep up with the events is cut off, it reconnects and its subscribers resync.
+MAX_PEER_BUFFER = 64 * 1024 * 1024  # bytes
+# Events published while the connection to the broker is down are kept, up to this many.
+MAX_BACKLOG = 10_000
+RECONNECT_INTERVAL = 0.2  # seconds
+
+# A line is one event, and it can be a whole prompt.
+LINE_LIMIT = 2**30
+
+
+class LocalEventBus:
+    """The SSE subscribers of this process, by project. Delivers the events to them."""
+
+    def __init__(self):
+        self.subscribers: Dict[str, List[EventSubscriber]] = defaultdict(list)
+
+    def publish(self, project: str, news: dict):
+        self.deliver(project, news)
+
+    def deliver(self, project: str, news: dict):
+        for subscriber in self.subscribers.get(project, ()):
+            subscriber.put(news)
+
+    def subscribe(self, project: str) -> EventSubscriber:
+        subscriber = EventSubscriber()
+        self.subscribers[project].append(subscriber)
+        return subscriber
+
+    def unsubscribe(self, project: str, subscriber: EventSubscriber):
+        subscribers = self.subscribers[project]
+        subscribers.remove(subscriber)
+        if not subscribers:
+            del self.subscribers[project]
+
+
+def encode_news(project: str, news: dict) -> bytes:
+    """One line of JSON. json.dumps() escapes the newlines, and WSMessage is kept apart, the subscribers merge those."""
+    data = news["data"]
+    is_message = isinstance(data, WSMessage)
+    if is_message:
+        data = data.model_dump_json()
+    elif isinstance(data, bytes):
+        data = data.decode()
+    elif not isinstance(data, str):
+        data = json.dumps(data)
+    return (json.dumps([project, news["event"].value, is_message, data]) + "\n").encode()
+
+
+def decode_news(line: list) -> dict:
+    _, event, is_message, data = line
+    return {"event": UpdateEvents(event), "data": WSMessage.model_validate_json(data) if is_message else data}
+
+
+class _Peer:
+    """One end of a connection between two processes. The lines sent in one event loop tick go out in one write."""
+
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self.projects: Set[str] = set()  # On the broker, the projects the other process has subscribers for
+        self._pending: List[bytes] = []
+
+    def send(self, line: bytes):
+        if not self._pending:
+            asyncio.get_running_loop().call_soon(self._flush)
+        self._pending.append(line)
+
+    def _flush(self):
+        if self.writer.is_closing():
+            self._pending.clear()
+            return
+        self.writer.write(b"".join(self._pending))
+        self._pending.clear()
+        if self.writer.transport.get_write_buffer_size() > MAX_PEER_BUFFER:
+            log.warning("Event bus peer is not reading, disconnecting it")
+            self.writer.close()
+
+
+class UnixSocketEventBus(LocalEventBus):
+    """Passes the events between the server processes, through a broker on a Unix socket.
+
+    The broker is whichever process takes the lock file first. It delivers the events it gets to its own
+    subscribers, and passes them on to the processes that have subscribers for that project.
+    If it exits, another process takes over. The subscribers of the processes that lost the connection get a
+    resync once they are back, the events sent in between might be lost. POSIX only.
+
+    Starts on first use, from the event loop."""
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self._task: Optional[asyncio.Task] = None
+        self._lock_fd: Optional[int] = None
+        self._peers: Set[_Peer] = set()  # When this process is the broker
+        self._broker: Optional[_Peer] = None  # When it's not, and it's connected
+        self._backlog: List[bytes] = []
+        self._lost = False  # The connection to the broker dropped, resync when back
+
+    @property
+    def is_broker(self) -> bool:
+        return self._lock_fd is not None
+
+    def publish(self, project: str, news: dict):
+        self.deliver(project, news)
+        self._start()
+        if self.is_broker:
+            peers = [peer for peer in self._peers if project in peer.projects]
+            if peers:
+                line = encode_news(project, news)
+                for peer in peers:
+                    peer.send(line)
+        elif self._broker is not None:
+            self._broker.send(encode_news(project, news))
+        elif len(self._backlog) < MAX_BACKLOG:
+            self._backlog.append(encode_news(project, news))
+
+    def subscribe(self, project: str) -> EventSubscriber:
+        self._start()
+        if project not in self.subscribers and self._broker is not None:
+            self._broker.send(json.dumps(["sub", project]).encode() + b"\n")
+        return super().subscribe(project)
+
+    def unsubscribe(self, project: str, subscriber: EventSubscriber):
+        super().unsubscribe(project, subscriber)
+        if project not in self.subscribers and self._broker is not None:
+            self._broker.send(json.dumps(["unsub", project]).encode() + b"\n")
+
+    def _start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run(), name="lovely-prompts-event-bus")
+
+    async def _run(self):
+        while True:
+            try:
+                if self.is_broker or self._take_lock():
+                    await self._serve()
+                else:
+                    await self._connect()
+            except OSError as e:
+                # The broker is not there yet, or it's going away. Keep trying.
+                log.debug("Event bus at %s: %s", self.path, e)
+            except Exception:
+                log.exception("Event bus at %s failed", self.path)
+            await asyncio.sleep(RECONNECT_INTERVAL)
+
+    def _take_lock(self) -> bool:
+        import fcntl
+
+        fd = os.open(self.path + ".lock", os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        # Held until the process exits, the OS releases it then. Any socket file left is from a broker that's gone.
+        self._lock_fd = fd
+        return True
+
+    async def _serve(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._backlog.clear()  # The other processes connect after this, there is no one to send it to
+        server = await asyncio.start_unix_server(self._handle_peer, self.path, limit=LINE_LIMIT)
+        log.info("Event bus broker on %s, pid %d", self.path, os.getpid())
+        self._resync()
+        async with server:
+            await server.serve_forever()
+
+    async def _handle_peer(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        peer = _Peer(writer)
+        self._peers.add(peer)
+        try:
+            while line := await reader.readline():
+                message = json.loads(line)
+                if len(message) == 2:
+                    action, project = message
+                    if action == "sub":
+                        peer.projects.add(project)
+                    else:
+                        peer.projects.discard(project)
+                    continue
+
+                project = message[0]
+                if project in self.subscribers:
+                    self.deliver(project, decode_news(message))
+                for other in self._peers:
+                    if other is not peer and project in other.projects:
+                        other.send(line)
+        except (ConnectionError, ValueError) as e:
+            log.warning("Event bus peer dropped: %s", e)
+        finally:
+            self._peers.discard(peer)
+            writer.close()
+
+    async def _connect(self):
+        reader, writer = await asyncio.open_unix_connection(self.path, limit=LINE_LIMIT)
+        broker = _Peer(writer)
+        for project in self.subscribers:
+            broker.send(json.dumps(["sub", project]).encode() + b"\n")
+        for line in self._backlog:
+            broker.send(line)
+        self._backlog.clear()
+        self._broker = broker
+        log.info("Event bus connected to %s", self.path)
+        # The subscriptions go out before anything else on the connection, the events from now on reach us.
+        self._resync()
+
+        try:
+            while line := await reader.readline():
+                message = json.loads(line)
+                self.deliver(message[0], decode_news(message))
+        except (ConnectionError, ValueError) as e:
+            log.warning("Event bus connection dropped: %s", e)
+        finally:
+            self._broker = None
+            self._lost = True
+            writer.close()
+
+    def _resync(self):
+        """Some events might have been lost while the connection was down, let the webapps reload.
+        Not before, they would reload while this process still misses the events."""
+        if self._lost:
+            self._lost = False
+            for project in list(self.subscribers):
+                self.deliver(project, {"event": UpdateEvents.RESYNC, "data": "{}"})
+
+
+def make_event_bus(spec: str = EVENT_BUS) -> LocalEventBus:
+    if spec == "local":
+        return LocalEventBus()
+    if spec.startswith("unix:"):
+        return UnixSocketEventBus(spec[len("unix:") :])
+    raise ValueError(f"Unknown LOVELY_PROMPTS_EVENT_BUS: {spec!r}, expected 'local' or 'unix:/path/to/socket'")
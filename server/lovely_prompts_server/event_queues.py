@@ -1,17 +1,116 @@
+from typing import AsyncIterator, Dict, List, Tuple
 
 from fastapi import FastAPI
-from asyncio import Queue
+from pydantic import BaseModel
+import asyncio
+import json
+from collections import deque
+
+from lovely_prompts_server.common import UpdateEvents
+from lovely_prompts_server.metrics import metrics
+
+
+# Stream appends for the same response and key are merged and sent at most once per tick.
+STREAM_TICK = 0.05  # seconds
+
+# A subscriber that falls this far behind gets a single resync event instead, and the webapp reloads.
+MAX_PENDING_EVENTS = 1000
+MAX_PENDING_CHARS = 1024 * 1024
+
+STREAM_EVENTS = (UpdateEvents.STREAM_CHAT_RESPONSE, UpdateEvents.STREAM_COMPLETION_RESPONSE)
+
+
+class EventSubscriber:
+    """Pending events for one SSE connection. Bounded, and it never blocks the publisher."""
+
+    def __init__(self, max_events=MAX_PENDING_EVENTS, max_chars=MAX_PENDING_CHARS, tick=STREAM_TICK):
+        self.max_events = max_events
+        self.max_chars = max_chars
+        self.tick = tick
+
+        self._events: deque = deque()
+        # (response id, key) -> [event, message, chunks], merged into one event per tick.
+        self._appends: Dict[Tuple[str, str], list] = {}
+        self._chars = 0
+        self._resync = False
+        self._wakeup = asyncio.Event()
+
+    def put(self, news: dict):
+        if self._resync:
+            return  # The webapp will reload everything anyway
+
+        data = news["data"]
+        if news["event"] in STREAM_EVENTS and data.action == "append":
+            value = str(data.value)
+            pending = self._appends.get((data.id, data.key))
+            if pending is None:
+                self._appends[(data.id, data.key)] = [news["event"], data, [value]]
+            else:
+                pending[2].append(value)
+            self._chars += len(value)
+        else:
+            # Keep the order, the earlier appends have to reach the webapp before this.
+            self._move_appends()
+            self._events.append(news)
+            self._chars += len(data) if isinstance(data, (str, bytes)) else 0
+
+        if len(self._events) + len(self._appends) > self.max_events or self._chars > self.max_chars:
+            self._events.clear()
+            self._appends.clear()
+            self._chars = 0
+            self._resync = True
+        self._wakeup.set()
+
+    @property
+    def depth(self) -> int:
+        """Events waiting to be sent, the merged appends count as one per response and key."""
+        return len(self._events) + len(self._appends)
+
+    def _move_appends(self):
+        for event, message, chunks in self._appends.values():
+            self._events.append({"event": event, "data": message.model_copy(update={"value": "".join(chunks)})})
+        self._appends.clear()
+
+    async def events(self) -> AsyncIterator[dict]:
+        """SSE-ready events, with `data` serialized."""
+        while True:
+            await self._wakeup.wait()
+            if self._appends and not self._events and not self._resync:
+                # Let more tokens arrive and send them together.
+                await asyncio.sleep(self.tick)
+            self._wakeup.clear()
+
+            if self._resync:
+                self._resync = False
+                yield {"event": UpdateEvents.RESYNC.value, "data": "{}"}
+                continue
+
+            self._move_appends()
+            self._chars = 0
+            while self._events:
+                news = self._events.popleft()
+                data = news["data"]
+                if isinstance(data, bytes):
+                    data = data.decode()  # Serialized already, by the handler that made the event
+                elif isinstance(data, BaseModel):
+                    data = data.model_dump_json()
+                elif not isinstance(data, str):
+                    data = json.dumps(data)
+                yield {"event": news["event"].value, "data": data}
+
+
+# The events go through app.event_bus, to the subscribers in this process and, with several workers,
+# in the others. See event_bus.py.
+
 
 def update_event_queues(app: FastAPI, news: dict, project: str):
-    for q in app.event_queues[project]:
-        q.put_nowait(news)
+    metrics.events.inc(project, news["event"].value)
+    app.event_bus.publish(project, news)
 
 
-def append_event_queue(app: FastAPI, project: str):
-    event_queue = Queue()
-    app.event_queues[project].append(event_queue)
-    return event_queue
+def append_event_queue(app: FastAPI, project: str) -> EventSubscriber:
+    return app.event_bus.subscribe(project)
 
-def remove_event_queue(app: FastAPI, event_queue: Queue, project: str):
-    app.event_queues[project].remove(event_queue)
 
+def remove_event_queue(app: FastAPI, subscriber: EventSubscriber, project: str):
+    app.event_bus.unsubscribe(project, subscriber)
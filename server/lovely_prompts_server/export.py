@@ -0,0 +1,175 @@
+from typing import Any, Dict, Iterator, List, Literal
+
+import json
+from datetime import datetime
+
+from sqlalchemy import Boolean, DateTime, Float, Integer, JSON, Table, select
+from sqlalchemy.engine import Connection
+
+from lovely_prompts_server.db.compression import CompressedJSON
+from lovely_prompts_server.db.local import (
+    ChatPromptSchema,
+    ChatResponseSchema,
+    CompletionPromptSchema,
+    CompletionResponseSchema,
+)
+
+
+# Export a whole project, a batch of rows at a time, so the memory use doesn't depend on the project size.
+#
+# JSONL has one entry per line, in the same {"type": ..., "entry": {...}} form /batch/ takes.
+# All the prompts come first, then all the responses, so the file can be loaded back in one pass.
+# Parquet and Arrow hold one table per file, pick it with `table`. These need pyarrow.
+
+ExportFormat = Literal["jsonl", "parquet", "arrow"]
+ExportTable = Literal["chat_prompts", "chat_responses", "completion_prompts", "completion_responses"]
+
+EXPORT_BATCH_SIZE = 1000
+
+# In the order they are exported, the prompts before the responses
+EXPORT_TABLES: Dict[str, Table] = {
+    "chat_prompts": ChatPromptSchema.__table__,
+    "completion_prompts": CompletionPromptSchema.__table__,
+    "chat_responses": ChatResponseSchema.__table__,
+    "completion_responses": CompletionResponseSchema.__table__,
+}
+
+# The entry types, as in models.BatchEntry
+EXPORT_TYPES = {
+    "chat_prompts": "chat_prompt",
+    "completion_prompts": "completion_prompt",
+    "chat_responses": "chat_response",
+    "completion_responses": "completion_response",
+}
+
+EXPORT_MEDIA_TYPES = {
+    "jsonl": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+
+def export_filename(project: str, format: ExportFormat, table: ExportTable) -> str:
+    return f"{project}.jsonl" if format == "jsonl" else f"{project}.{table}.{format}"
+
+
+def table_batches(connection: Connection, table: Table, batch_size=EXPORT_BATCH_SIZE) -> Iterator[List[Dict[str, Any]]]:
+    query = select(table).order_by(table.c.created, table.c.id)
+    result = connection.execution_options(yield_per=batch_size).execute(query)
+    for partition in result.mappings().partitions():
+        yield partition
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Can't export {type(value)}")
+
+
+def export_jsonl(connection: Connection) -> Iterator[bytes]:
+    for name, table in EXPORT_TABLES.items():
+        entry_type = EXPORT_TYPES[name]
+        for batch in table_batches(connection, table):
+            lines = []
+            for row in batch:
+                entry = {key: value for key, value in row.items() if value is not None}
+                lines.append(json.dumps({"type": entry_type, "entry": entry}, default=_json_default, ensure_ascii=False))
+            yield ("\n".join(lines) + "\n").encode()
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise RuntimeError("Parquet and Arrow export need pyarrow: pip install 'lovely-prompts-server[arrow]'")
+    return pyarrow
+
+
+def arrow_schema(table: Table):
+    pa = _import_pyarrow()
+    fields = []
+    for column in table.columns:
+        if isinstance(column.type, Integer):
+            type = pa.int64()
+        elif isinstance(column.type, Float):
+            type = pa.float64()
+        elif isinstance(column.type, Boolean):
+            type = pa.bool_()
+        elif isinstance(column.type, DateTime):
+            type = pa.timestamp("us")
+        else:
+            type = pa.string()  # JSON columns are exported as JSON text
+        fields.append(pa.field(column.name, type))
+    return pa.schema(fields)
+
+
+def _record_batch(table: Table, schema, batch: List[Dict[str, Any]]):
+    pa = _import_pyarrow()
+    columns = []
+    for column in table.columns:
+        values = [row[column.name] for row in batch]
+        if isinstance(column.type, (JSON, CompressedJSON)):
+            values = [None if value is None else json.dumps(value, ensure_ascii=False) for value in values]
+        columns.append(values)
+    arrays = [pa.array(values, type=field.type) for values, field in zip(columns, schema)]
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+class _ChunkSink:
+    """A write-only file for pyarrow, that hands the bytes written so far to the generator."""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def export_columnar(connection: Connection, format: ExportFormat, table_name: ExportTable) -> Iterator[bytes]:
+    pa = _import_pyarrow()
+    table = EXPORT_TABLES[table_name]
+    schema = arrow_schema(table)
+    sink = _ChunkSink()
+
+    if format == "parquet":
+        import pyarrow.parquet
+
+        writer = pyarrow.parquet.ParquetWriter(sink, schema)
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+
+    for batch in table_batches(connection, table):
+        writer.write_batch(_record_batch(table, schema, batch))
+        if data := sink.take():
+            yield data
+    writer.close()
+    yield sink.take()
+
+
+def export_project(
+    connection: Connection, format: ExportFormat = "jsonl", table: ExportTable = "chat_responses"
+) -> Iterator[bytes]:
+    """The export, in chunks. Raises RuntimeError right away if the format needs pyarrow and it's not installed."""
+    if format == "jsonl":
+        return export_jsonl(connection)
+    _import_pyarrow()
+    return export_columnar(connection, format, table)
@@ -1,13 +1,15 @@
-from typing import Awaitable, Callable, Dict, List
+from typing import Awaitable, Callable
 from fastapi import FastAPI
-from contextvars import ContextVar
 
-from asyncio import Queue
-from collections import defaultdict
+import logging
 
-from lovely_prompts_server.db.session import project_create
+from lovely_prompts_server.db.session import EngineRegistry, DBS_DIR, project_create
+from lovely_prompts_server.db.catalog import ProjectCatalog
+from lovely_prompts_server.event_bus import make_event_bus
 
 
+log = logging.getLogger(__name__)
+
 
 def register_startup_event(
     app: FastAPI,
@@ -25,10 +27,14 @@ def register_startup_event(
     # @app.on_event("startup")
     # async def _startup() -> None:  # noqa: WPS430
 
-    app.sessionmakers = ContextVar("sessionmakers", default={})
-    app.event_queues: Dict[str, List[Queue]] = defaultdict(list)
+    app.projects = ProjectCatalog(DBS_DIR)
+    app.engines = EngineRegistry(app.projects)
+    # Pick up project files deleted by hand, and close their engines.
+    app.projects.watch(on_removed=app.engines.retire)
+    app.event_bus = make_event_bus()
 
-    project_create("default")
-    print("Startup done")
+    project_create("default").dispose()
+    app.projects.add("default")
+    log.info("Startup done")
 
     # return _startup
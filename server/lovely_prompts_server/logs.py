@@ -0,0 +1,47 @@
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+
+
+# Configured from the environment, so it works the same under `uvicorn lovely_prompts_server.server:app`.
+#   LOVELY_PROMPTS_LOG_LEVEL    Level for the server logs, WARNING by default.
+#   LOVELY_PROMPTS_LOG_BODIES   1 to log the requests and their bodies at INFO. Off by default,
+#                               and then the middleware is not installed at all.
+#                               Works with any LOG_LEVEL, the body logger is set to INFO on its own.
+#   LOVELY_PROMPTS_LOG_SAMPLE   Fraction of the requests to log, 1.0 by default.
+#   LOVELY_PROMPTS_LOG_BODY_MAX Log at most this many bytes of a body, 1024 by default.
+LOG_LEVEL = os.environ.get("LOVELY_PROMPTS_LOG_LEVEL", "WARNING").upper()
+LOG_BODIES = os.environ.get("LOVELY_PROMPTS_LOG_BODIES", "0").lower() in ("1", "true", "yes")
+LOG_SAMPLE = float(os.environ.get("LOVELY_PROMPTS_LOG_SAMPLE", "1.0"))
+LOG_BODY_MAX = int(os.environ.get("LOVELY_PROMPTS_LOG_BODY_MAX", "1024"))
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+_listener = None
+
+
+def setup_logging(level=LOG_LEVEL, log_bodies=LOG_BODIES):
+    """Send the package logs through a queue, so the event loop never waits on stderr."""
+    global _listener
+    if _listener is not None:
+        return
+
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    logger = logging.getLogger("lovely_prompts_server")
+    logger.setLevel(level)
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    logger.propagate = False
+
+    if log_bodies:
+        # Asking for the bodies is enough, without lowering the level of all the other logs too.
+        body_logger = logging.getLogger("lovely_prompts_server.body_logging")
+        body_logger.setLevel(min(logging.INFO, logger.getEffectiveLevel()))
@@ -0,0 +1,198 @@
+from typing import Dict, Iterator, List, Tuple
+
+import bisect
+import time
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+# Counters for GET /metrics, in the Prometheus text format. The few metric types we need are here,
+# so there is no dependency on prometheus_client.
+#
+# They are updated inline on the hot paths, a dict lookup and an add each. Rates, like the rows or
+# the tokens per second, are left to Prometheus: rate(lovely_prompts_ingested_rows_total[1m]).
+# The values are for this process. With several workers, each one counts its own, and a scrape gets one of them.
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+Labels = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: Tuple[str, ...], values: Labels, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values: Dict[Labels, float] = {}
+
+    def inc(self, *labels: str, value: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + value
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.type}"
+        for labels, value in sorted(self.values.items()):
+            yield f"{self.name}{_labels(self.labels, labels)} {_number(value)}"
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def dec(self, *labels: str, value: float = 1):
+        self.inc(*labels, value=-value)
+
+    def set(self, *labels: str, value: float):
+        self.values[labels] = value
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        # labels -> [count per bucket, the last one is +Inf], sum
+        self.values: Dict[Labels, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *labels: str):
+        counts_sum = self.values.get(labels)
+        if counts_sum is None:
+            counts_sum = self.values[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+        counts_sum[0][bisect.bisect_left(self.buckets, value)] += 1
+        counts_sum[1][0] += value
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, (counts, total) in sorted(self.values.items()):
+            cumulative = 0
+            for le, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                bound = "+Inf" if le == float("inf") else _number(le)
+                bucket_labels = _labels(self.labels, labels, 'le="' + bound + '"')
+                yield f"{self.name}_bucket{bucket_labels} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labels, labels)} {_number(total[0])}"
+            yield f"{self.name}_count{_labels(self.labels, labels)} {cumulative}"
+
+
+class Metrics:
+    def __init__(self):
+        self.http_requests = Counter(
+            "lovely_prompts_http_requests_total", "HTTP requests by route and status.", ("method", "route", "status")
+        )
+        self.http_latency = Histogram(
+            "lovely_prompts_http_request_duration_seconds",
+            "Time to the response headers, by route. For /updates/ that's the time to open the SSE stream.",
+            ("method", "route"),
+        )
+        self.ingested_rows = Counter(
+            "lovely_prompts_ingested_rows_total",
+            "Prompts and responses written, from the API, /batch/ and /import/.",
+            ("project", "type"),
+        )
+        self.events = Counter(
+            "lovely_prompts_sse_events_total", "Update events published to the SSE subscribers.", ("project", "event")
+        )
+        self.sse_subscribers = Gauge(
+            "lovely_prompts_sse_subscribers", "Connected SSE subscribers, on /updates/.", ("project",)
+        )
+        self.sse_queue_depth = Gauge(
+            "lovely_prompts_sse_queue_depth", "Events waiting to be sent, over all the subscribers.", ("project",)
+        )
+        self.stream_websockets = Gauge(
+            "lovely_prompts_stream_websockets", "Open streaming websockets.", ("endpoint",)
+        )
+        self.stream_appends = Counter(
+            "lovely_prompts_stream_appends_total",
+            "Appends streamed into responses. About one per token, unless the client merges them into frames.",
+            ("project",),
+        )
+        self.stream_chars = Counter(
+            "lovely_prompts_stream_chars_total", "Characters appended to responses by streaming.", ("project",)
+        )
+        self.sqlite_commit = Histogram(
+            "lovely_prompts_sqlite_commit_seconds", "Flush and commit of the write sessions.", ("project",)
+        )
+        self.sqlite_write_wait = Histogram(
+            "lovely_prompts_sqlite_write_lock_wait_seconds",
+            "Time the writers spend queued on the project write lock, before they get to SQLite.",
+            ("project",),
+        )
+        self.sqlite_busy = Counter(
+            "lovely_prompts_sqlite_busy_total",
+            "Writes that failed with SQLITE_BUSY after busy_timeout, another process held the database.",
+            ("project",),
+        )
+
+    def collect(self, subscribers_by_project: dict):
+        """Update the gauges that are only read at scrape time."""
+        self.sse_subscribers.values.clear()
+        self.sse_queue_depth.values.clear()
+        for project, subscribers in subscribers_by_project.items():
+            self.sse_subscribers.set(project, value=len(subscribers))
+            self.sse_queue_depth.set(project, value=sum(subscriber.depth for subscriber in subscribers))
+
+    def render(self) -> str:
+        lines = []
+        for metric in vars(self).values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+class MetricsMiddleware:
+    """Count the HTTP requests and time them, by the route they matched. Plain ASGI, like BodyLoggingMiddleware."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = None
+
+        async def timed_send(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                # The route is known by now, the router has put it in the scope.
+                metrics.http_latency.observe(time.perf_counter() - start, scope["method"], _route(scope))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, timed_send)
+        finally:
+            if status is None:
+                status = 500
+                metrics.http_latency.observe(time.perf_counter() - start, scope["method"], _route(scope))
+            metrics.http_requests.inc(scope["method"], _route(scope), str(status))
+
+
+def _route(scope: Scope) -> str:
+    # The path template, so /chat_prompts/{prompt_id} is one route. Unmatched paths are lumped together.
+    route = scope.get("route")
+    return getattr(route, "path", "unmatched")
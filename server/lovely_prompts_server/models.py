@@ -1,4 +1,4 @@
-from typing import Any, List, Dict, Union, Optional, Literal
+from typing import Any, List, Dict, Union, Optional, Literal, Annotated
 from typing_extensions import Literal
 from pydantic import BaseModel, Field, ConfigDict
 from datetime import datetime
@@ -103,6 +103,7 @@ class ChatMessage(RowCommon):
 
 
 class ResponseBase(RowCommon):
+    id: Optional[str] = Field(None, example="chr_Cf5Gjbv9TCUSIexr", description="Client-generated id, the server makes one if missing")
     prompt_id: str = Field(None, example="chp_234243242")
 
     content: Optional[str] = Field(None, example="Flat, of course!")
@@ -116,6 +117,17 @@ class ResponseBase(RowCommon):
     temperature: Optional[float] = Field(None, example=0.7)
     provider: Optional[str] = Field(None, example="openai")
 
+    # Set by the server when the response is streamed, in seconds. Can be sent for responses that were not.
+    stream_start: Optional[datetime] = Field(
+        None, description="When the stream for the response started, UTC. The client's start time if it sent one"
+    )
+    ttft: Optional[float] = Field(None, example=0.45, description="Time to the first content, from stream_start")
+    stream_time: Optional[float] = Field(None, example=3.2, description="Time to the last content, from stream_start")
+    gap_p50: Optional[float] = Field(None, example=0.02, description="Median time between the content updates")
+    gap_p90: Optional[float] = Field(None, example=0.04)
+    gap_p99: Optional[float] = Field(None, example=0.2)
+    tok_per_sec: Optional[float] = Field(None, example=45.0, description="Tokens after the first one, per second")
+
 
 
 class ChatResponse(ResponseBase):
@@ -123,6 +135,7 @@ class ChatResponse(ResponseBase):
     # run_id: Optional[str] = Field(None, example="run_Cf5Gjbv9TCUSIexr")
 
 class ChatPrompt(RowCommon):
+    id: Optional[str] = Field(None, example="chp_Cf5Gjbv9TCUSIexr", description="Client-generated id, the server makes one if missing")
     prompt: Optional[List[ChatMessage]] = Field(
         None, example=[{"role": "user", "content": "What is the true shape of the Earth???"}]
     )
@@ -135,6 +148,7 @@ class CompletionResponse(ResponseBase):
     pass
 
 class CompletionPrompt(RowCommon):
+    id: Optional[str] = Field(None, example="cop_Cf5Gjbv9TCUSIexr", description="Client-generated id, the server makes one if missing")
     prompt: str = Field("", example="Bush did")
     responses: List[CompletionResponse] = Field([], alias="responses")
     # run_id: Optional[str] = Field(None, example="run_Cf5Gjbv9TCUSIexr")
@@ -142,11 +156,15 @@ class CompletionPrompt(RowCommon):
 
 # A record with the common SQL fields. This is used to pass the data to/from the server endpoints.
 class ChatPromptModel(ChatPrompt, SqlMeta):
-    pass
+    prompt_hash: Optional[str] = Field(
+        None, example="9f86d081884c7d65...", description="Hash of the messages, set by the server. See prompt_hash()"
+    )
 
 
 class CompletionPromptModel(CompletionPrompt, SqlMeta):
-    pass
+    prompt_hash: Optional[str] = Field(
+        None, example="9f86d081884c7d65...", description="Hash of the prompt, set by the server. See prompt_hash()"
+    )
 
 
 class ChatResponseModel(ChatResponse, SqlMeta):
@@ -183,26 +201,168 @@ class WSMessage(BaseModelNoUset):
 
 
 
+# Bulk ingestion. Prompts can carry nested responses, or responses can reference a prompt by (client-generated) id.
+class ChatPromptBatchEntry(BaseModelNoUset):
+    type: Literal["chat_prompt"]
+    entry: ChatPrompt
+
+
+class ChatResponseBatchEntry(BaseModelNoUset):
+    type: Literal["chat_response"]
+    entry: ChatResponse
+
+
+class CompletionPromptBatchEntry(BaseModelNoUset):
+    type: Literal["completion_prompt"]
+    entry: CompletionPrompt
+
+
+class CompletionResponseBatchEntry(BaseModelNoUset):
+    type: Literal["completion_response"]
+    entry: CompletionResponse
+
+
+BatchEntry = Annotated[
+    Union[ChatPromptBatchEntry, ChatResponseBatchEntry, CompletionPromptBatchEntry, CompletionResponseBatchEntry],
+    Field(discriminator="type"),
+]
+
+
+class Batch(BaseModelNoUset):
+    entries: List[BatchEntry] = Field([])
+
+
+class BatchResult(BaseModelNoUset):
+    chat_prompts: List[str] = Field([])
+    chat_responses: List[str] = Field([])
+    completion_prompts: List[str] = Field([])
+    completion_responses: List[str] = Field([])
+
+
+# Bulk import, in the format of the export. Like the batch entries, but with all the SQL fields.
+class ChatPromptImportEntry(BaseModelNoUset):
+    type: Literal["chat_prompt"]
+    entry: ChatPromptModel
+
+
+class ChatResponseImportEntry(BaseModelNoUset):
+    type: Literal["chat_response"]
+    entry: ChatResponseModel
+
+
+class CompletionPromptImportEntry(BaseModelNoUset):
+    type: Literal["completion_prompt"]
+    entry: CompletionPromptModel
+
+
+class CompletionResponseImportEntry(BaseModelNoUset):
+    type: Literal["completion_response"]
+    entry: CompletionResponseModel
+
+
+ImportEntry = Annotated[
+    Union[ChatPromptImportEntry, ChatResponseImportEntry, CompletionPromptImportEntry, CompletionResponseImportEntry],
+    Field(discriminator="type"),
+]
+
+
+class ImportResult(BaseModelNoUset):
+    chat_prompts: int = Field(0, description="Rows inserted. Rows with an id that already exists are skipped.")
+    chat_responses: int = Field(0)
+    completion_prompts: int = Field(0)
+    completion_responses: int = Field(0)
+    failed: int = Field(0, description="Lines that could not be imported")
+    errors: List[str] = Field([], description="The first few errors")
+
+
+class SearchResult(BaseModelNoUset):
+    type: Literal["chat_prompt", "chat_response"]
+    id: str = Field(None, example="chr_Cf5Gjbv9TCUSIexr")
+    prompt_id: Optional[str] = Field(None, example="chp_234243242", description="For responses")
+    title: Optional[str] = Field(None, example="The encounter")
+    snippet: str = Field(None, example="Flat, of <mark>course</mark>!")
+    rank: float = Field(None, description="bm25, lower is better")
+
+
+class StatsRow(BaseModelNoUset):
+    # Only the fields in group_by are set
+    bucket: Optional[str] = Field(None, example="2024-01-01")
+    model: Optional[str] = Field(None, example="gpt-3.5-turbo")
+    provider: Optional[str] = Field(None, example="openai")
+    stop_reason: Optional[str] = Field(None, example="length")
+
+    count: int = Field(None, example=100)
+    tok_in_sum: int = Field(None, example=1000)
+    tok_in_avg: Optional[float] = Field(None, example=10.0)
+    tok_out_sum: int = Field(None, example=2000)
+    tok_out_avg: Optional[float] = Field(None, example=20.0)
+    tok_max_avg: Optional[float] = Field(None, example=8000.0)
+    ttft_avg: Optional[float] = Field(None, example=0.45)
+    tok_per_sec_avg: Optional[float] = Field(None, example=45.0)
+
+    percentiles: Optional[Dict[str, Optional[float]]] = Field(
+        None, example={"tok_out_p50": 18, "tok_out_p99": 250, "ttft_p99": 1.5}
+    )
+
+
 from functools import partial
+import hashlib
+import json
 import string
 import nanoid
 
 
 generate_nonoid = partial(nanoid.generate, size=16)
 
+ID_ALPHABET = string.digits + string.ascii_lowercase + string.ascii_uppercase
+
+ID_PREFIXES = {
+    ChatPrompt: "chp_",
+    CompletionPrompt: "cop_",
+    ChatResponse: "chr_",
+    CompletionResponse: "cor_",
+}
+
 def make_id(entry_class=None):
     """Generate a unique ID for a DB entry. Also used to generate the name of the DB file."""
 
-    prefixes = {
-        ChatPrompt: "chp_",
-        CompletionPrompt: "cop_",
-        ChatResponse: "chr_",
-        CompletionResponse: "cor_",
-    }
+    return (ID_PREFIXES[entry_class] if entry_class else "") + generate_nonoid(alphabet=ID_ALPHABET)
+
+
+def canonical_prompt(messages: Union[List[Union[ChatMessage, dict]], str]) -> str:
+    """The messages as compact JSON with sorted keys, only the role and the content. Titles and comments don't count.
+    A completion prompt is a string already, it's used as is."""
+    if isinstance(messages, str):
+        return messages
+
+    canonical = []
+    for message in messages:
+        if isinstance(message, BaseModel):
+            message = message.model_dump()
+        canonical.append({"role": message.get("role"), "content": message.get("content")})
+    return json.dumps(canonical, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+
+def prompt_hash(messages: Union[List[Union[ChatMessage, dict]], str, None]) -> Optional[str]:
+    """sha256 of the canonical messages, or of the completion prompt.
+    The same conversation always gets the same hash."""
+    if messages is None:
+        return None
+    return hashlib.sha256(canonical_prompt(messages).encode()).hexdigest()
+
 
-    alphabet = string.digits + string.ascii_lowercase + string.ascii_uppercase
+def prompt_content_id(messages: Union[List[Union[ChatMessage, dict]], str, None], entry_class=ChatPrompt) -> str:
+    """A prompt id derived from the messages or the completion prompt, for the "reuse" mode.
+    Looks like the make_id() ones."""
+    if messages is None:
+        return make_id(entry_class)
 
-    return (prefixes[entry_class] if entry_class else "") + generate_nonoid(alphabet=alphabet)
+    n = int(prompt_hash(messages), 16)
+    chars = []
+    for _ in range(16):
+        n, digit = divmod(n, len(ID_ALPHABET))
+        chars.append(ID_ALPHABET[digit])
+    return ID_PREFIXES[entry_class] + "".join(chars)
 
 
 
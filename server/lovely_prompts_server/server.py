@@ -2,7 +2,6 @@ from typing import List, Dict, Optional
 from pydantic import BaseModel
 
 from fastapi import Depends, FastAPI, HTTPException, WebSocket, Request, WebSocketException, status, Query
-from starlette.middleware.base import BaseHTTPMiddleware
 
 from sqlalchemy.orm import Session, sessionmaker
 from sqlalchemy import create_engine
@@ -38,12 +37,24 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],  # The webapp reads the pagination cursor from it
 )
 
 
-from .body_logging import BodyLoggingMiddleware
+from .metrics import MetricsMiddleware
 
-app.add_middleware(BodyLoggingMiddleware)
+app.add_middleware(MetricsMiddleware)
+
+
+from .logs import LOG_BODIES, setup_logging
+
+setup_logging()
+
+# Opt-in, so there is no per-request cost unless you want the logs.
+if LOG_BODIES:
+    from .body_logging import BodyLoggingMiddleware
+
+    app.add_middleware(BodyLoggingMiddleware)
 
 
 from .lifetime import register_startup_event
@@ -63,16 +74,28 @@ from .api.projects import router as projects_router
 from .api.updates import router as updates_router
 from .api.chat_prompts import router as chat_prompts_router
 from .api.chat_responses import router as chat_responses_router
-# from .api.completion_prompts import router as completion_prompts_router
-# from .api.completion_responses import router as completion_responses_router
+from .api.batch import router as batch_router
+from .api.search import router as search_router
+from .api.stats import router as stats_router
+from .api.export import router as export_router
+from .api.bulk_import import router as import_router
+from .api.stream import router as stream_router
+from .api.completion_prompts import router as completion_prompts_router
+from .api.completion_responses import router as completion_responses_router
+from .api.metrics import router as metrics_router
 
 
 app.include_router(projects_router)
 app.include_router(updates_router)
 app.include_router(chat_prompts_router)
 app.include_router(chat_responses_router)
-
-
-# app.include_router(completion_prompts_router)
-# app.include_router(completion_responses_router)
+app.include_router(batch_router)
+app.include_router(search_router)
+app.include_router(stats_router)
+app.include_router(export_router)
+app.include_router(import_router)
+app.include_router(stream_router)
+app.include_router(completion_prompts_router)
+app.include_router(completion_responses_router)
+app.include_router(metrics_router)
 
@@ -0,0 +1,208 @@
+from typing import Any, Dict, List, Optional
+
+import logging
+import math
+import time
+from array import array
+from datetime import datetime, timezone
+
+from fastapi import FastAPI
+from starlette.requests import HTTPConnection
+from sqlalchemy import String, func, literal, update
+
+from lovely_prompts_server.common import UpdateEvents
+from lovely_prompts_server.db.compression import CompressedText
+from lovely_prompts_server.db.session import get_session
+from lovely_prompts_server.event_queues import update_event_queues
+from lovely_prompts_server.metrics import metrics
+from lovely_prompts_server.models import WSMessage
+
+
+log = logging.getLogger(__name__)
+
+
+# A streamed response is checkpointed to the DB when it has this much new data, or when the oldest
+# unsaved update is this old. Whatever is left is written when the stream closes.
+STREAM_FLUSH_SIZE = 64 * 1024  # characters
+STREAM_FLUSH_INTERVAL = 1.0  # seconds
+
+# Nearest-rank, like the /stats/ percentiles.
+GAP_PERCENTILES = {"gap_p50": 0.5, "gap_p90": 0.9, "gap_p99": 0.99}
+
+
+class StreamTiming:
+    """When the content of a streamed response arrives, as the server sees it. Written to the row on close.
+
+    The start is when the stream for this response opened, or `started` if the client sent it: the unix time it
+    sent the request to the model. The stream is usually opened once the model answers, that would leave the wait
+    out of the time to first token. A start in the future is taken as now.
+    The gaps are between the updates to the content, one per token if the client sends them as they come,
+    one per frame if it batches them.
+    tokens/sec counts tok_out if the stream sets it, and the content updates if not."""
+
+    def __init__(self, started: Optional[float] = None):
+        now = time.time()
+        started = now if started is None else min(started, now)
+        self.start = datetime.fromtimestamp(started, timezone.utc).replace(tzinfo=None)  # UTC, like `created`
+        self._start = time.monotonic() - (now - started)
+        self._first: Optional[float] = None
+        self._last: Optional[float] = None
+        self._gaps = array("d")
+        self._updates = 0
+        self._tokens: Optional[int] = None
+
+    def update(self, message: WSMessage):
+        if message.key == "content" and message.action != "delete":
+            now = time.monotonic()
+            if self._first is None:
+                self._first = now
+            else:
+                self._gaps.append(now - self._last)
+            self._last = now
+            self._updates += 1
+        elif message.key == "tok_out" and message.action == "replace" and isinstance(message.value, int):
+            self._tokens = message.value
+
+    def values(self) -> Dict[str, Any]:
+        """The timing columns, nothing if no content was streamed."""
+        if self._first is None:
+            return {}
+
+        tokens = self._tokens if self._tokens is not None else self._updates
+        generation = self._last - self._first
+        values = {
+            "stream_start": self.start,
+            "ttft": self._first - self._start,
+            "stream_time": self._last - self._start,
+            # The first token ends the wait, the rate is over the ones after it.
+            "tok_per_sec": (tokens - 1) / generation if tokens > 1 and generation > 0 else None,
+        }
+        gaps = sorted(self._gaps)
+        for name, q in GAP_PERCENTILES.items():
+            values[name] = gaps[max(0, math.ceil(q * len(gaps)) - 1)] if gaps else None
+        return values
+
+
+class StreamBuffer:
+    """Collects the updates to one row from a stream, and writes them to the DB in short transactions.
+
+    Appends are kept as a list of chunks, and concatenated in SQL at checkpoint time (`coalesce(col, '') || :new`),
+    so a token costs O(1) here no matter how long the content has grown.
+    The column stays uncompressed while it grows, close() compresses it once at the end."""
+
+    def __init__(
+        self,
+        schema,
+        id: str,
+        flush_size=STREAM_FLUSH_SIZE,
+        flush_interval=STREAM_FLUSH_INTERVAL,
+        started: Optional[float] = None,
+    ):
+        self.schema = schema
+        self.id = id
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+
+        self._sets: Dict[str, Any] = {}  # key -> value, for replace and delete
+        self._appends: Dict[str, List[str]] = {}  # key -> chunks appended after the value in _sets, if any
+        self._size = 0
+        self._first_pending: Optional[float] = None
+        self._appended = set()  # Keys appended to in SQL since the start, they might need compression
+        self.timing = StreamTiming(started)
+
+    def check(self, message: WSMessage) -> Optional[str]:
+        """Returns the reason if the message can't be applied to the row."""
+        column = self.schema.__table__.columns.get(message.key)
+        if column is None or message.key in ("id", "prompt_id"):
+            return f"Key {message.key} not in {self.schema.__name__}"
+        if message.action == "append" and not isinstance(column.type, (String, CompressedText)):
+            return f"Can't append to {message.key}, it's not a string"
+        return None
+
+    def apply(self, message: WSMessage):
+        if message.action == "append":
+            value = str(message.value)
+            self._appends.setdefault(message.key, []).append(value)
+            self._appended.add(message.key)
+            self._size += len(value)
+        else:
+            # replace and delete overwrite whatever was appended before
+            self._appends.pop(message.key, None)
+            self._sets[message.key] = message.value if message.action == "replace" else None
+            self._size += 1
+        self.timing.update(message)
+
+        if self._first_pending is None:
+            self._first_pending = time.monotonic()
+
+    @property
+    def pending(self) -> bool:
+        return self._first_pending is not None
+
+    def time_to_flush(self) -> Optional[float]:
+        """Seconds until a checkpoint is due. 0 if it's due now, None if there is nothing to write."""
+        if not self.pending:
+            return None
+        if self._size >= self.flush_size:
+            return 0
+        return max(0, self._first_pending + self.flush_interval - time.monotonic())
+
+    def _values(self) -> Dict[str, Any]:
+        values = dict(self._sets)
+        for key, chunks in self._appends.items():
+            new = "".join(chunks)
+            if key in self._sets:
+                values[key] = ("" if self._sets[key] is None else str(self._sets[key])) + new
+            else:
+                # lp_text(), the column might be compressed already, see compression.py
+                column = getattr(self.schema, key)
+                values[key] = func.coalesce(func.lp_text(column, type_=String), "") + literal(new, String)
+        return values
+
+    async def flush(self, request: HTTPConnection, project: str, final=False):
+        """A checkpoint. The final one also compresses the appended columns and writes the timing."""
+        values = self._values() if self.pending else {}
+        if final:
+            values.update(self.timing.values())
+            for key in self._appended:
+                if isinstance(self.schema.__table__.columns[key].type, CompressedText):
+                    values[key] = func.lp_compress(values.get(key, getattr(self.schema, key)), type_=String)
+        if not values:
+            return
+
+        async with get_session(request=request, project=project, write=True) as db:
+            await db.execute(update(self.schema).where(self.schema.id == self.id).values(values))
+        log.debug("Checkpointed %s: %d characters", self.id, self._size)
+
+        self._sets.clear()
+        self._appends.clear()
+        self._size = 0
+        self._first_pending = None
+
+    async def close(self, request: HTTPConnection, project: str):
+        """Write what's left, and compress the appended columns."""
+        await self.flush(request, project, final=True)
+        self._appended.clear()
+
+
+def stream_updates(
+    app: FastAPI,
+    project: str,
+    stream: StreamBuffer,
+    messages: List[WSMessage],
+    event: UpdateEvents = UpdateEvents.STREAM_CHAT_RESPONSE,
+):
+    """Apply the updates to the buffer, and pass them on to the webapp. ValueError if one can't be applied."""
+    appends = chars = 0
+    for message in messages:
+        if (reason := stream.check(message)) is not None:
+            raise ValueError(reason)
+        stream.apply(message)
+        if message.action == "append":
+            appends += 1
+            chars += len(str(message.value))
+        # The subscribers merge the appends, so pass the model.
+        update_event_queues(app, {"event": event, "data": message}, project=project)
+    if appends:
+        metrics.stream_appends.inc(project, value=appends)
+        metrics.stream_chars.inc(project, value=chars)
@@ -0,0 +1,143 @@
+from typing import Any, List, Optional, Tuple, Union
+
+import json
+
+
+# The compact protocol for the update stream, for clients that ask for it with the websocket subprotocol.
+# Without it, every frame is one JSON WSMessage.
+#
+# A frame is a list of deltas, [action, key, value], in order. The action and the key are indexes into
+# WS_ACTIONS and WS_KEYS, or the names as strings. `value` can be left out for "delete".
+# Text frames are JSON, binary frames are msgpack. msgpack is optional, on both sides.
+#
+# The client is expected to batch the tokens into frames, see Logger.stream_chat_response_contents.
+#
+# Over the multiplexed /stream/ endpoint a frame is a list of [response_id, deltas] groups instead.
+# A group without deltas, [response_id], ends that response, the server writes it out and drops its buffer.
+# A group with an empty list, [response_id, []], opens it before the first update. The server times the stream
+# from when the response opens, send it before waiting on the model to get the time to first token right.
+# Or add the time the client sent the request to the model, in unix seconds: [response_id, deltas, started].
+# The stream is timed from that, it only counts in the group that opens the response.
+# If the server can't stream into a response, it's not there or an update doesn't fit it, the server sends back
+# {"id": response_id, "error": reason} as a JSON text frame, saves what it got so far and ignores the rest of that
+# response. The other responses on the connection are not affected.
+# Don't forget to update the clients if you change this.
+
+WS_COMPACT_PROTOCOL = "lp.compact.v1"
+
+WS_ACTIONS = ("append", "replace", "delete")
+WS_KEYS = (
+    "content",
+    "stop_reason",
+    "tok_in",
+    "tok_out",
+    "tok_max",
+    "model",
+    "temperature",
+    "provider",
+    "role",
+    "title",
+    "comment",
+)
+
+Delta = Tuple[str, str, Any]  # (action, key, value)
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+def _name(names: Tuple[str, ...], value: Union[int, str]) -> str:
+    if isinstance(value, int) and not isinstance(value, bool) and 0 <= value < len(names):
+        return names[value]
+    if isinstance(value, str):
+        return value
+    raise ValueError(f"Invalid action or key: {value!r}")
+
+
+def _loads(data: Union[str, bytes]) -> Any:
+    if isinstance(data, bytes):
+        if msgpack is None:
+            raise ValueError("Binary frames need msgpack on the server: pip install 'lovely-prompts-server[msgpack]'")
+        try:
+            return msgpack.unpackb(data)
+        except Exception as e:
+            raise ValueError(f"Invalid msgpack: {e}")
+    return json.loads(data)
+
+
+def _dumps(frame: list, binary: Optional[bool]) -> Union[str, bytes]:
+    """Binary (msgpack) by default if it's installed."""
+    if binary is None:
+        binary = msgpack is not None
+    return msgpack.packb(frame) if binary else json.dumps(frame, separators=(",", ":"))
+
+
+def decode_deltas(frame: Any) -> List[Delta]:
+    """Raises ValueError if the deltas are malformed. Consecutive appends to the same key are merged."""
+    if not isinstance(frame, list):
+        raise ValueError("Expected a list of deltas")
+
+    deltas: List[Delta] = []
+    for delta in frame:
+        if not isinstance(delta, list) or not 2 <= len(delta) <= 3:
+            raise ValueError(f"Invalid delta: {delta!r}")
+        action, key = _name(WS_ACTIONS, delta[0]), _name(WS_KEYS, delta[1])
+        value = delta[2] if len(delta) == 3 else None
+        if action not in WS_ACTIONS:
+            raise ValueError(f"Invalid action: {action}")
+        if action != "delete" and not isinstance(value, (str, int, float, bool)):
+            raise ValueError(f"Invalid value for {key}: {value!r}")
+
+        if action == "append" and deltas and deltas[-1][0] == "append" and deltas[-1][1] == key:
+            deltas[-1] = (action, key, deltas[-1][2] + str(value))
+        else:
+            deltas.append((action, key, str(value) if action == "append" else value))
+    return deltas
+
+
+def encode_deltas(deltas: List[Delta]) -> list:
+    frame = []
+    for action, key, value in deltas:
+        delta = [WS_ACTIONS.index(action), WS_KEYS.index(key) if key in WS_KEYS else key]
+        if action != "delete":
+            delta.append(value)
+        frame.append(delta)
+    return frame
+
+
+def decode_frame(data: Union[str, bytes]) -> List[Delta]:
+    return decode_deltas(_loads(data))
+
+
+def encode_frame(deltas: List[Delta], binary: Optional[bool] = None) -> Union[str, bytes]:
+    return _dumps(encode_deltas(deltas), binary)
+
+
+def decode_mux_frame(data: Union[str, bytes]) -> List[Tuple[str, Optional[Any], Optional[float]]]:
+    """[(response id, deltas, started)], deltas is None when the response is done, started is None if not sent.
+    The deltas are not decoded yet, use decode_deltas() on each, so an error only stops that response."""
+    frame = _loads(data)
+    if not isinstance(frame, list):
+        raise ValueError("Expected a list of [response_id, deltas]")
+
+    groups = []
+    for group in frame:
+        if not isinstance(group, list) or len(group) not in (1, 2, 3) or not isinstance(group[0], str):
+            raise ValueError(f"Invalid group: {str(group)[:50]}")
+        started = group[2] if len(group) == 3 else None
+        if started is not None and (isinstance(started, bool) or not isinstance(started, (int, float))):
+            raise ValueError(f"Invalid start time: {str(started)[:50]}")
+        groups.append((group[0], group[1] if len(group) >= 2 else None, started))
+    return groups
+
+
+def encode_mux_frame(groups: List[tuple], binary: Optional[bool] = None) -> Union[str, bytes]:
+    """groups are (response id, deltas), or (response id, deltas, started) to open the response with a start time."""
+    frame = [[id] if deltas is None else [id, encode_deltas(deltas), *started] for id, deltas, *started in groups]
+    return _dumps(frame, binary)
+
+
+def encode_mux_error(id: str, reason: str) -> str:
+    return json.dumps({"id": id, "error": reason})
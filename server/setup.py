@@ -8,6 +8,12 @@ setup(
     author_email='alex@lovely-prompts.io',
     description='Lovely Prompts API server',
     packages=find_packages(),
-    install_requires=['fastapi', 'uvicorn', 'pydantic', 'requests'], # Add other dependencies
+    install_requires=['fastapi', 'uvicorn', 'pydantic', 'requests', 'sqlalchemy[asyncio]>=2.0', 'aiosqlite'], # Add other dependencies
+    extras_require={
+        'arrow': ['pyarrow'],  # Parquet and Arrow export
+        'msgpack': ['msgpack'],  # Binary frames in the compact streaming protocol
+        'test': ['pytest', 'httpx'],
+    },
+    entry_points={'console_scripts': ['lovely-prompts-server=lovely_prompts_server.cli:main']},
 )
 
@@ -0,0 +1,27 @@
+import os
+import tempfile
+
+# The server creates its default project on import, keep the test projects out of the real data dir.
+os.environ["XDG_DATA_HOME"] = tempfile.mkdtemp(prefix="lovely_prompts_tests_")
+
+import pytest
+from sqlalchemy import create_engine, event
+
+from lovely_prompts_server.db.compression import register_sqlite_functions
+from lovely_prompts_server.db.local import Base
+from lovely_prompts_server.db.migrate import migrate
+from lovely_prompts_server.db.session import set_sqlite_pragmas
+
+
+@pytest.fixture
+def connection(tmp_path):
+    """A sync connection to a new project DB, set up like project_create() does it."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    event.listen(engine, "connect", set_sqlite_pragmas)
+    event.listen(engine, "connect", register_sqlite_functions)
+    with engine.connect() as connection:
+        Base.metadata.create_all(bind=connection)
+        migrate(connection)
+        connection.commit()
+        yield connection
+    engine.dispose()
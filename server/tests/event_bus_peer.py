@@ -0,0 +1,52 @@
+"""One server process for test_event_bus.py: an event bus with one subscriber, driven through stdin and stdout.
+
+    python tests/event_bus_peer.py /path/to/events.sock
+
+Commands, one per line:
+    pub <text>   publish a new_chp event with the text as data
+    state        print "state broker <n>", "state connected" or "state down".
+                 n is the number of the other processes subscribed through the broker.
+Prints "got <event> <data>" for every event the subscriber sends.
+"""
+
+import asyncio
+import json
+import sys
+
+from lovely_prompts_server.common import UpdateEvents
+from lovely_prompts_server.event_bus import UnixSocketEventBus
+
+
+PROJECT = "test"
+
+
+def state(bus: UnixSocketEventBus) -> str:
+    if bus.is_broker:
+        return f"broker {sum(PROJECT in peer.projects for peer in bus._peers)}"
+    return "connected" if bus._broker is not None else "down"
+
+
+async def main(path: str):
+    bus = UnixSocketEventBus(path)
+    subscriber = bus.subscribe(PROJECT)
+
+    async def send():
+        async for event in subscriber.events():
+            print("got", event["event"], event["data"], flush=True)
+
+    sender = asyncio.create_task(send())
+
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+    while line := await reader.readline():
+        command, _, text = line.decode().strip().partition(" ")
+        if command == "pub":
+            bus.publish(PROJECT, {"event": UpdateEvents.NEW_CHAT_PROMPT, "data": json.dumps(text)})
+        elif command == "state":
+            print("state", state(bus), flush=True)
+    sender.cancel()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(sys.argv[1]))
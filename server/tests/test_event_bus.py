@@ -0,0 +1,145 @@
+import json
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+
+SERVER_DIR = Path(__file__).parent.parent
+PEER = Path(__file__).parent / "event_bus_peer.py"
+TIMEOUT = 10  # seconds
+
+
+class Peer:
+    """A server process with the unix socket event bus, see event_bus_peer.py."""
+
+    def __init__(self, path: Path):
+        # In front of what's there already, so the peer finds the same packages as the tests.
+        python_path = os.pathsep.join(filter(None, [str(SERVER_DIR), os.environ.get("PYTHONPATH")]))
+        env = dict(os.environ, PYTHONPATH=python_path)
+        self.process = subprocess.Popen(
+            [sys.executable, str(PEER), str(path)],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+            env=env,
+        )
+        self.lines = []  # Everything printed, but the state replies
+        self._output = queue.Queue()
+        threading.Thread(target=self._read, daemon=True).start()
+
+    def _read(self):
+        for line in self.process.stdout:
+            self._output.put(line.rstrip("\n"))
+
+    def _next(self, deadline: float) -> str:
+        try:
+            return self._output.get(timeout=max(0, deadline - time.monotonic()))
+        except queue.Empty:
+            raise AssertionError(f"No output from the peer, got {self.lines}")
+
+    def send(self, command: str):
+        self.process.stdin.write(command + "\n")
+        self.process.stdin.flush()
+
+    def publish(self, text: str):
+        self.send(f"pub {text}")
+
+    def state(self) -> str:
+        self.send("state")
+        deadline = time.monotonic() + TIMEOUT
+        while not (line := self._next(deadline)).startswith("state "):
+            self.lines.append(line)
+        return line[len("state ") :]
+
+    def wait_state(self, *states: str) -> str:
+        deadline = time.monotonic() + TIMEOUT
+        while (state := self.state()) not in states:
+            assert time.monotonic() < deadline, f"Still {state}"
+            time.sleep(0.05)
+        return state
+
+    def wait_event(self, event: str, data: str = "{}"):
+        line = f"got {event} {data}"
+        deadline = time.monotonic() + TIMEOUT
+        while line not in self.lines:
+            self.lines.append(self._next(deadline))
+
+    def wait_published(self, text: str):
+        self.wait_event("new_chp", json.dumps(text))
+
+    def received(self, text: str) -> bool:
+        return f"got new_chp {json.dumps(text)}" in self.lines
+
+    def kill(self):
+        self.process.kill()
+        self.process.wait()
+
+
+@pytest.fixture
+def peers(tmp_path):
+    started = []
+
+    def start() -> Peer:
+        peer = Peer(tmp_path / "events.sock")
+        started.append(peer)
+        return peer
+
+    yield start
+    for peer in started:
+        peer.kill()
+
+
+def test_delivered_between_processes(peers):
+    a = peers()
+    a.wait_state("broker 0")
+    b, c = peers(), peers()
+    a.wait_state("broker 2")  # Both subscribed
+
+    a.publish("from the broker")
+    b.publish("from a peer")
+    for peer in a, b, c:
+        peer.wait_published("from the broker")
+        peer.wait_published("from a peer")
+
+
+def test_recovers_after_broker_exit(peers):
+    a = peers()
+    a.wait_state("broker 0")
+    b, c = peers(), peers()
+    a.wait_state("broker 2")
+
+    a.kill()
+    # Kept until b is connected again, it waits RECONNECT_INTERVAL before it tries.
+    b.wait_state("down")
+    b.publish("during the handover")
+
+    # One of them takes over, the other connects to it and subscribes again.
+    states = {b.wait_state("broker 1", "connected"), c.wait_state("broker 1", "connected")}
+    assert states == {"broker 1", "connected"}
+    broker = b if b.state().startswith("broker") else c
+    # Events might have been lost in between, both resync once they are back.
+    b.wait_event("resync")
+    c.wait_event("resync")
+    b.wait_published("during the handover")
+    if broker is c:
+        c.wait_published("during the handover")
+
+    b.publish("after the handover, from b")
+    c.publish("after the handover, from c")
+    for peer in b, c:
+        peer.wait_published("after the handover, from b")
+        peer.wait_published("after the handover, from c")
+
+    # A new process joins the new broker.
+    d = peers()
+    broker.wait_state("broker 2")
+    d.publish("from d")
+    for peer in b, c, d:
+        peer.wait_published("from d")
+    assert "got resync {}" not in d.lines
@@ -0,0 +1,108 @@
+import asyncio
+import json
+
+from lovely_prompts_server.common import UpdateEvents
+from lovely_prompts_server.event_queues import MAX_PENDING_CHARS, MAX_PENDING_EVENTS, EventSubscriber
+from lovely_prompts_server.models import WSMessage
+
+
+def new_prompt(i: int) -> dict:
+    return {"event": UpdateEvents.NEW_CHAT_PROMPT, "data": json.dumps({"id": f"chp_{i}"})}
+
+
+def append(id: str, value: str, key="content") -> dict:
+    message = WSMessage(id=id, prompt_id="chp_0", action="append", key=key, value=value)
+    return {"event": UpdateEvents.STREAM_CHAT_RESPONSE, "data": message}
+
+
+def sent(subscriber: EventSubscriber, timeout=0.3) -> list:
+    """The events the subscriber sends, until it has nothing more for `timeout` seconds."""
+
+    async def collect():
+        events = []
+        it = subscriber.events()
+        try:
+            while True:
+                events.append(await asyncio.wait_for(it.__anext__(), timeout))
+        except asyncio.TimeoutError:
+            return events
+
+    return asyncio.run(collect())
+
+
+def test_appends_merged():
+    subscriber = EventSubscriber()
+    for i in range(500):
+        subscriber.put(append("chr_1", f" t{i}"))
+
+    events = sent(subscriber)
+    assert len(events) == 1
+    assert events[0]["event"] == "stream_chr"
+    data = json.loads(events[0]["data"])
+    assert data["id"] == "chr_1" and data["action"] == "append" and data["key"] == "content"
+    assert data["value"] == "".join(f" t{i}" for i in range(500))
+
+
+def test_appends_merged_per_response_and_key():
+    subscriber = EventSubscriber()
+    for i in range(10):
+        subscriber.put(append("chr_1", "a"))
+        subscriber.put(append("chr_2", "b"))
+        subscriber.put(append("chr_1", "c", key="title"))
+
+    merged = {(d["id"], d["key"]): d["value"] for d in (json.loads(e["data"]) for e in sent(subscriber))}
+    assert merged == {("chr_1", "content"): "a" * 10, ("chr_2", "content"): "b" * 10, ("chr_1", "title"): "c" * 10}
+
+
+def test_order_kept_around_other_events():
+    subscriber = EventSubscriber()
+    subscriber.put(append("chr_1", "a"))
+    subscriber.put(append("chr_1", "b"))
+    subscriber.put(new_prompt(1))
+    subscriber.put(append("chr_1", "c"))
+
+    events = sent(subscriber)
+    assert [e["event"] for e in events] == ["stream_chr", "new_chp", "stream_chr"]
+    assert [json.loads(e["data"]).get("value") for e in events] == ["ab", None, "c"]
+
+
+def test_too_many_events_resync():
+    subscriber = EventSubscriber()
+    for i in range(MAX_PENDING_EVENTS + 1):
+        subscriber.put(new_prompt(i))
+
+    assert sent(subscriber) == [{"event": "resync", "data": "{}"}]
+
+
+def test_too_many_chars_resync():
+    subscriber = EventSubscriber()
+    chunk = "x" * 1024
+    for _ in range(MAX_PENDING_CHARS // len(chunk) + 1):
+        subscriber.put(append("chr_1", chunk))
+
+    assert sent(subscriber) == [{"event": "resync", "data": "{}"}]
+
+
+def test_events_after_resync():
+    subscriber = EventSubscriber(max_events=10)
+
+    async def run():
+        it = subscriber.events()
+        for i in range(20):
+            subscriber.put(new_prompt(i))
+        first = await it.__anext__()
+        subscriber.put(new_prompt(100))
+        return first, await asyncio.wait_for(it.__anext__(), 1)
+
+    first, second = asyncio.run(run())
+    assert first["event"] == "resync"
+    assert second["event"] == "new_chp" and json.loads(second["data"])["id"] == "chp_100"
+
+
+def test_under_limits_all_sent():
+    subscriber = EventSubscriber()
+    for i in range(MAX_PENDING_EVENTS):
+        subscriber.put(new_prompt(i))
+
+    events = sent(subscriber)
+    assert [json.loads(e["data"])["id"] for e in events] == [f"chp_{i}" for i in range(MAX_PENDING_EVENTS)]
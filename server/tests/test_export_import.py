@@ -0,0 +1,88 @@
+import json
+
+from lovely_prompts_server.bulk_import import LineSplitter, import_lines
+from lovely_prompts_server.export import EXPORT_TABLES, export_jsonl
+
+
+ENTRIES = [
+    {
+        "type": "chat_prompt",
+        "entry": {
+            "id": "chp_1",
+            "prompt": [{"role": "user", "content": "Hi"}],
+            "responses": [{"id": "chr_1", "content": "Hello", "model": "gpt-4", "tok_out": 1}],
+        },
+    },
+    {"type": "chat_response", "entry": {"id": "chr_2", "prompt_id": "chp_1", "content": "Hey"}},
+    {
+        "type": "completion_prompt",
+        "entry": {"id": "cop_1", "prompt": "Once upon a time", "responses": [{"id": "cor_1", "content": " there"}]},
+    },
+    {"type": "completion_response", "entry": {"id": "cor_2", "prompt_id": "cop_1", "content": " was", "ttft": 0.25}},
+]
+
+
+def counts(result) -> tuple:
+    return result.chat_prompts, result.chat_responses, result.completion_prompts, result.completion_responses
+
+
+def export_lines(connection) -> list:
+    return [json.loads(line) for line in b"".join(export_jsonl(connection)).decode().splitlines()]
+
+
+def test_roundtrip(connection):
+    result = import_lines(connection, [json.dumps(entry) for entry in ENTRIES])
+    assert counts(result) == (1, 2, 1, 2)
+    assert result.failed == 0
+
+    exported = export_lines(connection)
+    assert [line["type"] for line in exported] == [
+        "chat_prompt",
+        "completion_prompt",
+        "chat_response",
+        "chat_response",
+        "completion_response",
+        "completion_response",
+    ]
+
+    for table in reversed(EXPORT_TABLES):
+        connection.exec_driver_sql(f"DELETE FROM {table}")
+    connection.commit()
+
+    result = import_lines(connection, [json.dumps(line) for line in exported])
+    assert counts(result) == (1, 2, 1, 2)
+    assert export_lines(connection) == exported
+
+    # The same file again, everything is there already
+    result = import_lines(connection, [json.dumps(line) for line in exported])
+    assert counts(result) == (0, 0, 0, 0)
+
+
+def test_response_without_prompt_id(connection):
+    result = import_lines(connection, [json.dumps({"type": "completion_response", "entry": {"content": "x"}})])
+    assert result.failed == 1
+    assert "completion_response needs a prompt_id" in result.errors[0]
+
+
+def test_timestamps_to_utc(connection):
+    entries = [
+        {"type": "chat_prompt", "entry": {"id": "chp_1", "created": "2024-01-01T12:00:00+02:00"}},
+        {"type": "chat_prompt", "entry": {"id": "chp_2", "created": "2024-01-01T11:00:00"}},  # Naive, UTC already
+    ]
+    import_lines(connection, [json.dumps(entry) for entry in entries])
+    rows = connection.exec_driver_sql("SELECT id, created, updated FROM chat_prompts ORDER BY created").all()
+    # As text, that's how the pagination compares them
+    assert [(id, created[:19], updated[:19]) for id, created, updated in rows] == [
+        ("chp_1", "2024-01-01 10:00:00", "2024-01-01 10:00:00"),
+        ("chp_2", "2024-01-01 11:00:00", "2024-01-01 11:00:00"),
+    ]
+
+
+def test_line_splitter():
+    splitter = LineSplitter()
+    body = b'{"a": 1}\n' + b'{"long": "' + b"x" * 10_000 + b'"}\n{"b": \xc3\xa9}'
+    lines = []
+    for i in range(0, len(body), 7):  # Also splits the UTF-8 character
+        lines += splitter.feed(body[i : i + 7])
+    lines.append(splitter.rest())
+    assert lines == body.decode().split("\n")
@@ -0,0 +1,19 @@
+from lovely_prompts_server.db.fts import FTS_TRIGGERS
+from lovely_prompts_server.db.migrate import drop_derived, migrate
+from lovely_prompts_server.db.stats import STATS_TRIGGERS
+
+
+def triggers(connection) -> set:
+    return set(connection.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'trigger'").scalars())
+
+
+def test_drop_derived_keeps_other_triggers(connection):
+    connection.exec_driver_sql("CREATE TRIGGER user_audit AFTER INSERT ON chat_prompts BEGIN SELECT 1; END")
+    ours = set(FTS_TRIGGERS) | set(STATS_TRIGGERS)
+    assert triggers(connection) == ours | {"user_audit"}
+
+    drop_derived(connection)
+    assert triggers(connection) == {"user_audit"}
+
+    migrate(connection)
+    assert triggers(connection) == ours | {"user_audit"}
@@ -0,0 +1,69 @@
+# The hashes and the content ids are stored in the DBs, "reuse" and the dedup find the existing prompts by them.
+# These values must never change, or the prompts logged before the change would not be matched any more.
+
+from lovely_prompts_server.models import (
+    ChatMessage,
+    ChatPrompt,
+    CompletionPrompt,
+    canonical_prompt,
+    prompt_content_id,
+    prompt_hash,
+)
+
+
+MESSAGES = [
+    {"role": "system", "content": "Be brief."},
+    {"role": "user", "content": "Was ist die Form der Erde? 🌍"},
+]
+CANONICAL = '[{"content":"Be brief.","role":"system"},{"content":"Was ist die Form der Erde? 🌍","role":"user"}]'
+HASH = "d7b0992ee0e91fff4c56b382f09f00fd6be1ff926cce52ce8738b3ae5538ca83"
+CONTENT_ID = "chp_Tk7ZS5W2r6BmJIiH"
+
+COMPLETION = "Once upon a time"
+COMPLETION_HASH = "e286222c229ec73b1bc520d88583191572ae0cbbaa66ea68053994a5e50ac87a"
+COMPLETION_ID = "cop_aerosD49lpiTUTVq"
+
+
+def test_chat_golden():
+    assert canonical_prompt(MESSAGES) == CANONICAL
+    assert prompt_hash(MESSAGES) == HASH
+    assert prompt_content_id(MESSAGES) == CONTENT_ID
+
+
+def test_key_order():
+    reordered = [{"content": m["content"], "role": m["role"]} for m in MESSAGES]
+    assert prompt_hash(reordered) == HASH
+    assert prompt_content_id(reordered) == CONTENT_ID
+
+
+def test_extra_fields_ignored():
+    extra = [dict(m, name="bob", title="t", comment="c", tool_calls=None) for m in MESSAGES]
+    assert prompt_hash(extra) == HASH
+
+    models = [ChatMessage(title="t", comment="c", **m) for m in MESSAGES]
+    assert prompt_hash(models) == HASH
+    assert prompt_content_id(models) == CONTENT_ID
+
+
+def test_message_order_counts():
+    assert prompt_hash(MESSAGES[::-1]) != HASH
+
+
+def test_completion_golden():
+    assert canonical_prompt(COMPLETION) == COMPLETION
+    assert prompt_hash(COMPLETION) == COMPLETION_HASH
+    assert prompt_content_id(COMPLETION, CompletionPrompt) == COMPLETION_ID
+
+
+def test_chat_and_completion_ids_apart():
+    # A completion prompt is hashed as is, so one that happens to be the canonical JSON of a chat has the same hash.
+    # The ids still differ, by the prefix.
+    assert prompt_hash(CANONICAL) == HASH
+    assert prompt_content_id(CANONICAL, CompletionPrompt) == "cop_" + CONTENT_ID[len("chp_") :]
+    assert prompt_content_id(MESSAGES, ChatPrompt) == CONTENT_ID
+
+
+def test_no_prompt():
+    assert prompt_hash(None) is None
+    assert prompt_content_id(None) != prompt_content_id(None)  # Random, like make_id()
+    assert prompt_content_id(None).startswith("chp_")
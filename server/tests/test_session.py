@@ -0,0 +1,65 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from lovely_prompts_server.db import session
+from lovely_prompts_server.db.local import ChatPromptSchema
+from lovely_prompts_server.db.session import EngineRegistry, get_session
+
+
+@pytest.fixture
+def request_(tmp_path, monkeypatch):
+    """Just enough of a request for get_session(), with the projects in a temporary dir."""
+    monkeypatch.setattr(session, "DBS_DIR", str(tmp_path))
+    return SimpleNamespace(app=SimpleNamespace(engines=EngineRegistry(set())))
+
+
+def run(request_, body):
+    async def main():
+        try:
+            await body()
+        finally:
+            await request_.app.engines.dispose_all()
+
+    asyncio.run(main())
+
+
+async def stored(request_, id: str):
+    async with get_session(request=request_, project="test") as db:
+        return await db.get(ChatPromptSchema, id)
+
+
+def test_committed(request_):
+    async def body():
+        async with get_session(request=request_, project="test", write=True) as db:
+            db.add(ChatPromptSchema(id="chp_1"))
+        assert await stored(request_, "chp_1") is not None
+
+    run(request_, body)
+
+
+def test_not_committed_on_error(request_):
+    async def body():
+        with pytest.raises(RuntimeError, match="boom"):
+            async with get_session(request=request_, project="test", write=True) as db:
+                db.add(ChatPromptSchema(id="chp_1"))
+                await db.flush()
+                raise RuntimeError("boom")
+        assert await stored(request_, "chp_1") is None
+
+    run(request_, body)
+
+
+def test_original_error_kept(request_):
+    # Committing after the failed flush would raise PendingRollbackError instead.
+    async def body():
+        async with get_session(request=request_, project="test", write=True) as db:
+            db.add(ChatPromptSchema(id="chp_1"))
+        with pytest.raises(IntegrityError):
+            async with get_session(request=request_, project="test", write=True) as db:
+                db.add(ChatPromptSchema(id="chp_1"))
+                await db.flush()
+
+    run(request_, body)
@@ -0,0 +1,83 @@
+import itertools
+import json
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from lovely_prompts_server.server import app
+from lovely_prompts_server.ws_protocol import WS_COMPACT_PROTOCOL, encode_mux_frame
+
+
+PROJECT = "stream_test"
+_unknown_ids = (f"chr_not_there_{i}" for i in itertools.count())
+
+
+@pytest.fixture
+def client():
+    with TestClient(app) as client:
+        yield client
+
+
+def new_response(client: TestClient) -> str:
+    prompt = client.post(
+        "/chat_prompts/", params={"project": PROJECT}, json={"prompt": [{"role": "user", "content": "Hi"}]}
+    )
+    prompt_id = prompt.json()["id"]
+    response = client.post("/chat_responses/", params={"project": PROJECT}, json={"prompt_id": prompt_id})
+    return response.json()["id"]
+
+
+def append(value: str) -> tuple:
+    return ("append", "content", value)
+
+
+def send(groups: list) -> str:
+    return encode_mux_frame(groups, binary=False)
+
+
+def wait_handled(ws):
+    """The frames are handled in order, once the server fails a frame sent now, it's done with the ones before."""
+    id = next(_unknown_ids)
+    ws.send_text(send([(id, [append("sync")])]))
+    assert json.loads(ws.receive_text())["id"] == id
+
+
+def content(client: TestClient, id: str) -> str:
+    return client.get(f"/chat_responses/{id}", params={"project": PROJECT}).json().get("content")
+
+
+def test_bad_stream_next_to_good_one(client):
+    good, bad = new_response(client), new_response(client)
+    missing = "chr_not_there"
+
+    with client.websocket_connect(f"/stream/?project={PROJECT}", subprotocols=[WS_COMPACT_PROTOCOL]) as ws:
+        ws.send_text(send([(good, [append("one")]), (missing, [append("lost")]), (bad, [append("a")])]))
+        assert json.loads(ws.receive_text()) == {"id": missing, "error": f"Response {missing} not found"}
+
+        # A delta that doesn't decode only fails its own response.
+        frame = json.loads(send([(good, [append(" two")])]))
+        frame.append([bad, [["nope"]]])
+        ws.send_text(json.dumps(frame))
+        error = json.loads(ws.receive_text())
+        assert error["id"] == bad and error["error"]
+
+        # Ignored after the error.
+        ws.send_text(send([(bad, [append("b")]), (good, [append(" three")]), (good, None)]))
+        wait_handled(ws)
+
+    assert content(client, good) == "one two three"
+    assert content(client, bad) == "a"  # Saved up to the error
+
+
+def test_timed_from_client_start(client):
+    id = new_response(client)
+
+    with client.websocket_connect(f"/stream/?project={PROJECT}", subprotocols=[WS_COMPACT_PROTOCOL]) as ws:
+        # Opened once the model answers, the request to it went out 5 seconds before.
+        ws.send_text(send([(id, [], time.time() - 5)]))
+        ws.send_text(send([(id, [append("Hi")]), (id, None)]))
+        wait_handled(ws)
+
+    response = client.get(f"/chat_responses/{id}", params={"project": PROJECT}).json()
+    assert 5 <= response["ttft"] < 6
@@ -27,6 +27,14 @@ interface Data_LLMResponse extends ChatMessage, SQLRow {
     temperature?: number;
     provider?: string;
     meta?: Record<string, unknown>;
+    // Measured by the server on streamed responses, in seconds
+    stream_start?: string;
+    ttft?: number;
+    stream_time?: number;
+    gap_p50?: number;
+    gap_p90?: number;
+    gap_p99?: number;
+    tok_per_sec?: number;
 }
 
 interface Data_LLMPrompt extends Chunk, SQLRow {